@@ -3,14 +3,8 @@ import re
 import shutil
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
-import chardet
-
-# 检测文件编码，避免编码错误
-def detect_encoding(file_path):
-    with open(file_path, 'rb') as f:
-        raw = f.read(1000)
-    result = chardet.detect(raw)
-    return result['encoding'] or 'utf-8'
+# 检测文件编码，避免编码错误；结果缓存到磁盘，重复扫描时跳过检测
+from 编码检测 import detect_encoding, save_encoding_cache
 
 # 自动对正则表达式中的特殊字符进行转义
 def escape_regex_special_chars(s):
@@ -39,6 +33,8 @@ def regex_replace_in_strm(folder, target_text, replacement, name_filter, log_fil
                     preview_map[full_path] = (content.strip(), new_content.strip())
                     modified_files.append(full_path)
 
+    save_encoding_cache()
+
     # 记录被修改的文件到日志
     with open(log_file, 'w', encoding='utf-8') as log:
         for path in modified_files:
@@ -1,90 +1,599 @@
 import os
 import re
-import chardet
+import gzip
+import shutil
+import queue
+import zipfile
+import itertools
+import numpy as np
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, scrolledtext
 from datetime import datetime
+from collections import OrderedDict
+from threading import Thread, Event, Lock
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from 编码检测 import detect_encoding, save_encoding_cache, sniff_encoding
 
-def detect_encoding(file_path):
-    with open(file_path, 'rb') as f:
-        rawdata = f.read(10000)  # 读取前1万字节检测编码
-    result = chardet.detect(rawdata)
-    return result['encoding'] or 'utf-8'
-
-def format_timestamp(ms_total, fmt):
-    h, rem = divmod(ms_total, 3600000)
-    m, rem = divmod(rem, 60000)
-    s, ms = divmod(rem, 1000)
-
-    if fmt == 'srt':
-        return f'{h:02d}:{m:02d}:{s:02d},{ms:03d}'
-    elif fmt == 'vtt':
-        return f'{h:02d}:{m:02d}:{s:02d}.{ms:03d}'
-    else:
-        raise ValueError("不支持的字幕格式")
+# 标准时间轴行 "HH:MM:SS,mmm --> HH:MM:SS,mmm" 的宽度、数字所在列和各列对应的毫秒数
+CUE_LINE_WIDTH = 29
+CUE_TEMPLATE = np.frombuffer(b'00:00:00,000 --> 00:00:00,000', dtype=np.uint8)
+CUE_DIGIT_COLS = np.array([0, 1, 3, 4, 6, 7, 9, 10, 11, 17, 18, 20, 21, 23, 24, 26, 27, 28])
+CUE_FIXED_COLS = np.array([2, 5, 12, 13, 14, 15, 16, 19, 22])
+CUE_SEP_COLS = np.array([8, 25])
+CUE_DIGIT_WEIGHTS = np.array([36000000, 3600000, 600000, 60000, 10000, 1000, 100, 10, 1], dtype=np.int64)
+# 非标准宽度的时间轴行（数字位数不同、带 VTT 样式设置、行首有空白等）逐行用正则解析
+CUE_TIME_RE = re.compile(r'\s*(\d+):(\d+):(\d+)[,.](\d+)[ \t]*-->[ \t]*(\d+):(\d+):(\d+)[,.](\d+)(.*)')
+# 时、分、秒、毫秒对应的毫秒数
+MS_UNITS = np.array([3600000, 60000, 1000, 1], dtype=np.int64)
+# 调整后的时间限制在 [0, 99:59:59.999] 内，保证小时始终是两位数
+MAX_TIMESTAMP_MS = 100 * 3600000 - 1
+# 支持的字幕格式
+SUBTITLE_FORMATS = ('srt', 'vtt', 'ass', 'ssa')
+# ASS/SSA 的起止时间是 Dialogue/Comment 行的第 2、3 个字段，格式 H:MM:SS.cc（百分之一秒）
+ASS_FORMATS = ('ass', 'ssa')
+ASS_EVENT_RE = re.compile(r'^([ \t]*(?:Dialogue|Comment):[^,\n]*,)[ \t]*(\d+):(\d+):(\d+)\.(\d+)[ \t]*,'
+                          r'[ \t]*(\d+):(\d+):(\d+)\.(\d+)[ \t]*(?=,)', re.M)
+ASS_UNITS = np.array([3600000, 60000, 1000, 10], dtype=np.int64)
+# ASS 的小时只有一位
+MAX_ASS_MS = 10 * 3600000 - 10
+# 预览时每个文件显示的时间轴条数
+PREVIEW_CUES = 10
+# 已读取字幕的缓存上限（按文本字符数计），超过 SUBTITLE_CACHE_MAX_FILE 字节的文件不缓存
+SUBTITLE_CACHE_CHARS = 256 * 1024 * 1024
+SUBTITLE_CACHE_MAX_FILE = 16 * 1024 * 1024
+# 流式处理时每次读取的字符数（按整行取整）
+STREAM_BLOCK_CHARS = 1 << 18
+# 输出方式：输出目录下只用文件名 / 输出目录下保留相对子目录 / 原地覆盖源文件
+OUTPUT_FLAT = 'flat'
+OUTPUT_TREE = 'tree'
+OUTPUT_INPLACE = 'inplace'
+# 原地修改时的备份目录（位于字幕文件夹下），备份为 gzip 压缩的原文件
+BACKUP_DIR = 'bak'
+# 自动对齐：语音活动信号的时间分辨率（毫秒）和允许的最大偏移（秒）
+SYNC_RESOLUTION_MS = 10
+SYNC_MAX_OFFSET_S = 600
+# 信号长度取结束时间的该百分位数再加最大偏移，个别异常的超大时间轴不会撑大 FFT
+SYNC_LENGTH_PERCENTILE = 99
+# 按文件名中的季/集号（如 S01E02）配对参考字幕
+EPISODE_RE = re.compile(r'[Ss](\d{1,2})[ ._-]*[Ee](\d{1,3})')
+# 扫描时后台线程每攒够这么多文件就交给界面插入一批，界面每次刷新最多插入 SCAN_ROWS_PER_TICK 行
+SCAN_BATCH = 500
+SCAN_ROWS_PER_TICK = 2000
+# 压缩包内的字幕用 "压缩包路径::包内路径" 表示，扫描时会列出 zip 中的字幕
+ARCHIVE_SEP = '::'
+ARCHIVE_EXTS = ('.zip',)
 
-def parse_time_to_ms(timestamp, fmt):
-    if fmt == 'srt':
-        h, m, s_ms = timestamp.split(':')
-        s, ms = s_ms.split(',')
-    elif fmt == 'vtt':
-        h, m, s_ms = timestamp.split(':')
-        s, ms = s_ms.split('.')
-    else:
-        raise ValueError("不支持的字幕格式")
-    return int(h)*3600000 + int(m)*60000 + int(s)*1000 + int(ms)
+def parse_stretch(text):
+    """解析时间缩放倍数，支持小数或“源帧率/目标帧率”（如 23.976/25），留空为 1"""
+    text = text.strip()
+    if not text:
+        return 1.0
+    if '/' in text:
+        src, dst = text.split('/', 1)
+        return float(src) / float(dst)
+    return float(text)
+
+def find_cue_lines(data):
+    """返回 UTF-8 字节数组中所有包含 '-->' 的行的 (起始位置, 结束位置) 数组，不含换行符"""
+    arrows = np.flatnonzero((data[:-2] == ord('-')) & (data[1:-1] == ord('-')) & (data[2:] == ord('>')))
+    newlines = np.flatnonzero(data == ord('\n'))
+    line_no = np.unique(np.searchsorted(newlines, arrows))
+    bounds = np.concatenate(([-1], newlines, [len(data)]))
+    return bounds[line_no] + 1, bounds[line_no + 1]
+
+def parse_cues(data):
+    """
+    找出 UTF-8 字节数组中的所有时间轴行，返回 (起始位置, 结束位置, 起止时间, 非标准行)。
+    起止时间为 n×2 的 int64 毫秒数组。标准宽度的行一次取成字节矩阵整体校验和换算；
+    其余行逐行用正则解析，非标准行为 {序号: 行尾}，行尾是时间之后的 VTT 样式设置等内容。
+    """
+    starts, ends = find_cue_lines(data)
+    times = np.zeros((len(starts), 2), dtype=np.int64)
+    parsed = np.zeros(len(starts), dtype=bool)
+
+    fixed = np.flatnonzero(ends - starts == CUE_LINE_WIDTH)
+    if len(fixed):
+        chars = data[starts[fixed, None] + np.arange(CUE_LINE_WIDTH)]
+        digits = chars[:, CUE_DIGIT_COLS] - ord('0')
+        seps = chars[:, CUE_SEP_COLS]
+        valid = ((digits < 10).all(axis=1)
+                 & (chars[:, CUE_FIXED_COLS] == CUE_TEMPLATE[CUE_FIXED_COLS]).all(axis=1)
+                 & ((seps == ord(',')) | (seps == ord('.'))).all(axis=1))
+        times[fixed[valid]] = digits[valid].reshape(-1, 2, 9).astype(np.int64) @ CUE_DIGIT_WEIGHTS
+        parsed[fixed[valid]] = True
+
+    irregular = {}
+    for k in np.flatnonzero(~parsed).tolist():
+        line = data[starts[k]:ends[k]].tobytes().decode('utf-8', errors='replace')
+        match = CUE_TIME_RE.fullmatch(line)
+        if match:
+            times[k] = np.array(match.groups()[:8], dtype=np.int64).reshape(2, 4) @ MS_UNITS
+            irregular[k] = match.group(9).rstrip()
+            parsed[k] = True
+
+    keep = np.flatnonzero(parsed)
+    if irregular:
+        # 序号换算为去掉无效行之后的位置
+        irregular = dict(zip(np.searchsorted(keep, list(irregular)).tolist(), irregular.values()))
+    return starts[keep], ends[keep], times[keep], irregular
+
+def retime(times, shift_ms, stretch=1.0, max_ms=MAX_TIMESTAMP_MS):
+    """先按 stretch 缩放再加上偏移，结果限制在 [0, max_ms] 内，整个数组一次完成"""
+    if stretch != 1.0:
+        times = np.rint(times * stretch).astype(np.int64)
+    return np.clip(times + shift_ms, 0, max_ms)
+
+def format_cue_chars(times, fmt):
+    """把 n×2 的毫秒数组批量格式化为 "HH:MM:SS,mmm --> HH:MM:SS,mmm"（vtt 用 '.'）的字节矩阵"""
+    h, rem = np.divmod(times, 3600000)
+    m, rem = np.divmod(rem, 60000)
+    s, milli = np.divmod(rem, 1000)
+    digits = np.stack([h // 10, h % 10, m // 10, m % 10, s // 10, s % 10,
+                       milli // 100, milli // 10 % 10, milli % 10], axis=-1).reshape(len(times), len(CUE_DIGIT_COLS))
+    chars = np.empty((len(times), CUE_LINE_WIDTH), dtype=np.uint8)
+    chars[:] = CUE_TEMPLATE
+    chars[:, CUE_DIGIT_COLS] = digits + ord('0')
+    chars[:, CUE_SEP_COLS] = ord(',') if fmt == 'srt' else ord('.')
+    return chars
+
+def chars_to_str(chars):
+    return chars.view(f'S{CUE_LINE_WIDTH}')[:, 0].astype(f'U{CUE_LINE_WIDTH}').tolist()
+
+def format_ass_times(times):
+    """把毫秒数组格式化为 ASS 的 H:MM:SS.cc 字符串列表（四舍五入到百分之一秒）"""
+    cs = (times.ravel() + 5) // 10
+    h, rem = np.divmod(cs, 360000)
+    m, rem = np.divmod(rem, 6000)
+    s, c = np.divmod(rem, 100)
+    return [f"{a}:{b:02d}:{d:02d}.{e:02d}" for a, b, d, e in zip(h.tolist(), m.tolist(), s.tolist(), c.tolist())]
+
+def shift_ass_text(text, shift_ms, stretch=1.0, limit=None):
+    """
+    调整 ASS/SSA 事件行的起止时间，返回 (新文本, [(原时间, 新时间), ...])。
+    limit 不为空时只找前 limit 行（用于预览），此时新文本不完整。
+    """
+    matches = ASS_EVENT_RE.finditer(text)
+    if limit is not None:
+        matches = itertools.islice(matches, limit)
+    matches = list(matches)
+    if not matches:
+        return text, []
+    times = np.array([m.groups()[1:9] for m in matches], dtype=np.int64).reshape(-1, 2, 4) @ ASS_UNITS
+    stamps = format_ass_times(retime(times, shift_ms, stretch, MAX_ASS_MS))
+    pieces = []
+    changes = []
+    last = 0
+    for k, match in enumerate(matches):
+        start, end = stamps[2 * k], stamps[2 * k + 1]
+        old = f"{text[match.start(2):match.end(5)]} --> {text[match.start(6):match.end(9)]}"
+        changes.append((old, f"{start} --> {end}"))
+        pieces.append(text[last:match.start(2)])
+        pieces.append(f"{start},{end}")
+        last = match.end(9)
+    pieces.append(text[last:])
+    return ''.join(pieces), changes
+
+def split_archive_path(file_path):
+    """拆分为 (压缩包路径, 包内路径)，普通文件返回 (原路径, None)"""
+    if ARCHIVE_SEP in file_path:
+        archive, member = file_path.split(ARCHIVE_SEP, 1)
+        return archive, member
+    return file_path, None
+
+def decode_subtitle_bytes(raw):
+    """
+    解码压缩包内的字幕，返回 (文本, 原换行符)。
+    文本中的换行统一为 \\n，与文本模式打开散文件时一致。
+    """
+    text = raw.decode(sniff_encoding(raw), errors='ignore')
+    newline = '\r\n' if '\r\n' in text else '\n'
+    return text.replace('\r\n', '\n').replace('\r', '\n'), newline
+
+class SubtitleDoc:
+    """一个字幕文件解码后的文本，完整的时间轴解析结果在第一次用到时才计算并保留"""
+
+    def __init__(self, text, fmt):
+        self.text = text
+        self.fmt = fmt
+        self.cues = None
+
+    @classmethod
+    def load(cls, file_path, fmt):
+        archive, member = split_archive_path(file_path)
+        if member is not None:
+            # 压缩包内的字幕直接在内存中解压和解码
+            with zipfile.ZipFile(archive) as zf:
+                return cls(decode_subtitle_bytes(zf.read(member))[0], fmt)
+        encoding = detect_encoding(file_path)
+        with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
+            return cls(f.read(), fmt)
+
+    def parse(self):
+        """返回 (UTF-8 字节数组, 起始位置, 结束位置, 起止时间, 非标准行)"""
+        if self.cues is None:
+            data = np.frombuffer(self.text.encode('utf-8'), dtype=np.uint8)
+            self.cues = (data,) + parse_cues(data)
+        return self.cues
+
+    def times(self):
+        """返回所有对白的 n×2 毫秒起止时间数组（ASS/SSA 不含 Comment 行）"""
+        if self.fmt in ASS_FORMATS:
+            rows = [m.groups()[1:9] for m in ASS_EVENT_RE.finditer(self.text) if 'Dialogue' in m.group(1)]
+            if not rows:
+                return np.zeros((0, 2), dtype=np.int64)
+            return np.array(rows, dtype=np.int64).reshape(-1, 2, 4) @ ASS_UNITS
+        return self.parse()[3]
+
+    def preview(self, shift_ms, stretch=1.0, limit=PREVIEW_CUES):
+        """
+        返回前 limit 条时间轴的 [(原时间轴, 新时间轴), ...]。
+        已完整解析过时直接取数组的前几项，否则只逐行查找到第 limit 条为止。
+        """
+        if self.fmt in ASS_FORMATS:
+            return shift_ass_text(self.text, shift_ms, stretch, limit)[1]
+        if self.cues is not None:
+            _, changes = self.shifted(shift_ms, stretch)
+            return changes[:limit]
+        olds, tails, times = [], [], []
+        pos = self.text.find('-->')
+        while pos >= 0 and len(olds) < limit:
+            start = self.text.rfind('\n', 0, pos) + 1
+            end = self.text.find('\n', pos)
+            end = len(self.text) if end < 0 else end
+            match = CUE_TIME_RE.fullmatch(self.text, start, end)
+            if match:
+                olds.append(match.group(0).strip())
+                tails.append(match.group(9).rstrip())
+                times.append([int(x) for x in match.groups()[:8]])
+            pos = self.text.find('-->', end)
+        if not olds:
+            return []
+        times = np.array(times, dtype=np.int64).reshape(-1, 2, 4) @ MS_UNITS
+        news = chars_to_str(format_cue_chars(retime(times, shift_ms, stretch), self.fmt))
+        return [(old, new + tail) for old, new, tail in zip(olds, news, tails)]
+
+    def shifted(self, shift_ms, stretch=1.0):
+        """
+        调整所有时间轴，返回 (新文本, [(原时间轴, 新时间轴), ...])。
+        在 UTF-8 字节数组上整体定位、解析和格式化；标准时间轴行宽度不变，直接原位覆盖，
+        只有少量非标准行需要逐行拼接。
+        """
+        if self.fmt in ASS_FORMATS:
+            return shift_ass_text(self.text, shift_ms, stretch)
+        data, starts, ends, times, irregular = self.parse()
+        new_chars = format_cue_chars(retime(times, shift_ms, stretch), self.fmt)
+
+        old_lines = np.empty(len(starts), dtype=object)
+        new_lines = np.empty(len(starts), dtype=object)
+        regular = np.ones(len(starts), dtype=bool)
+        regular[list(irregular)] = False
+        cols = starts[regular, None] + np.arange(CUE_LINE_WIDTH)
+        old_lines[regular] = chars_to_str(data[cols])
+        new_lines[:] = chars_to_str(new_chars)
+        out = data.copy()
+        out[cols] = new_chars[regular]
+
+        pieces = []
+        last = 0
+        for k, tail in irregular.items():
+            old_lines[k] = out[starts[k]:ends[k]].tobytes().decode('utf-8', errors='replace').strip()
+            new_lines[k] += tail
+            pieces.append(out[last:starts[k]].tobytes())
+            pieces.append(new_lines[k].encode('utf-8'))
+            last = ends[k]
+        pieces.append(out[last:].tobytes())
+        return b''.join(pieces).decode('utf-8'), list(zip(old_lines.tolist(), new_lines.tolist()))
+
+class SubtitleCache:
+    """
+    按 (路径, 修改时间, 大小) 缓存已读取的字幕，预览和批量处理共用，
+    先预览再处理时每个文件只读取和检测编码一次。超出容量时淘汰最久未用的文件。
+    压缩包内的字幕按所在压缩包的修改时间和大小判断是否有效。
+    """
+
+    def __init__(self, max_chars=SUBTITLE_CACHE_CHARS):
+        self.max_chars = max_chars
+        self.entries = OrderedDict()
+        self.chars = 0
+        self.lock = Lock()
 
-def shift_timestamp_line(line, shift_ms, fmt):
-    start, end = line.strip().split(' --> ')
-    start_ms = parse_time_to_ms(start, fmt) + shift_ms
-    end_ms = parse_time_to_ms(end, fmt) + shift_ms
+    def peek(self, file_path):
+        """返回仍然有效的缓存，没有缓存或文件已变化时返回 None"""
+        try:
+            st = os.stat(split_archive_path(file_path)[0])
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(file_path)
+            if entry is None or entry[0] != (st.st_mtime_ns, st.st_size):
+                return None
+            self.entries.move_to_end(file_path)
+            return entry[1]
+
+    def get(self, file_path, fmt):
+        doc = self.peek(file_path)
+        if doc is not None:
+            return doc
+        st = os.stat(split_archive_path(file_path)[0])
+        doc = SubtitleDoc.load(file_path, fmt)
+        with self.lock:
+            old = self.entries.pop(file_path, None)
+            if old is not None:
+                self.chars -= len(old[1].text)
+            self.entries[file_path] = ((st.st_mtime_ns, st.st_size), doc)
+            self.chars += len(doc.text)
+            while self.chars > self.max_chars and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.chars -= len(evicted.text)
+        return doc
 
-    start_ms = max(start_ms, 0)
-    end_ms = max(end_ms, 0)
+subtitle_cache = SubtitleCache()
 
-    return f"{format_timestamp(start_ms, fmt)} --> {format_timestamp(end_ms, fmt)}\n"
+def shift_subtitle_text(text, fmt, shift_ms, stretch=1.0):
+    """调整文本中所有时间轴，返回 (新文本, [(原时间轴, 新时间轴), ...])"""
+    return SubtitleDoc(text, fmt).shifted(shift_ms, stretch)
 
-def process_subtitle(file_path, shift_seconds, output_dir):
+def subtitle_format(file_path):
+    """按扩展名返回字幕格式，不支持时返回 None"""
     fmt = os.path.splitext(file_path)[-1].lower().lstrip('.')
-    if fmt not in ['srt', 'vtt']:
-        return None, "不支持的字幕格式"
+    return fmt if fmt in SUBTITLE_FORMATS else None
 
-    encoding = detect_encoding(file_path)
+def iter_text_blocks(f, block_chars=STREAM_BLOCK_CHARS):
+    """按整行分块读取文本，每块约 block_chars 个字符"""
+    while True:
+        lines = f.readlines(block_chars)
+        if not lines:
+            break
+        yield ''.join(lines)
 
-    with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-        lines = f.readlines()
+def shift_stream(src, dst, fmt, shift_ms, stretch=1.0, limit=PREVIEW_CUES):
+    """
+    逐块读取、调整并写出，内存占用只与块大小有关，只保留前 limit 条改动用于预览。
+    dst 为空时只做预览，凑够 limit 条就停止读取。
+    """
+    preview = []
+    for block in iter_text_blocks(src):
+        if dst is None:
+            preview.extend(SubtitleDoc(block, fmt).preview(shift_ms, stretch, limit - len(preview)))
+            if len(preview) >= limit:
+                break
+            continue
+        new_block, changes = shift_subtitle_text(block, fmt, shift_ms, stretch)
+        preview.extend(changes[:limit - len(preview)])
+        dst.write(new_block)
+    return preview
 
-    shift_ms = int(shift_seconds * 1000)
-    output_lines = []
-    preview_changes = []  # 用于预览原时间->新时间
+def subtitle_output_path(file_path, mode, output_dir, input_root=None):
+    """
+    按输出方式计算输出路径，保留子目录时按需创建目录。
+    压缩包内的字幕输出为散文件，保留子目录时放在以压缩包名（去掉扩展名）命名的目录下。
+    """
+    if mode == OUTPUT_INPLACE:
+        return file_path
+    archive, member = split_archive_path(file_path)
+    if member is not None:
+        rel = os.path.normpath(member).lstrip('\\/')
+        if rel.startswith('..'):
+            # 包内路径试图跳出目录时只保留文件名
+            rel = os.path.basename(rel)
+        file_path = os.path.join(os.path.splitext(archive)[0], rel)
+    if mode == OUTPUT_TREE and input_root:
+        out_path = os.path.join(output_dir, os.path.relpath(file_path, input_root))
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        return out_path
+    return os.path.join(output_dir, os.path.basename(file_path))
 
-    for line in lines:
-        if '-->' in line:
-            try:
-                old_line = line.strip()
-                new_line = shift_timestamp_line(line, shift_ms, fmt).strip()
-                output_lines.append(new_line + '\n')
-                preview_changes.append((old_line, new_line))
-            except Exception as e:
-                output_lines.append(line)
-        else:
-            output_lines.append(line)
+def backup_subtitle(file_path, input_root=None):
+    """
+    把原文件 gzip 压缩备份到 字幕文件夹/bak/相对路径.gz。
+    已有备份时保留不动，多次调整后仍能找回最初的文件。
+    """
+    root = input_root or os.path.dirname(file_path)
+    backup_path = os.path.join(root, BACKUP_DIR, os.path.relpath(file_path, root) + '.gz')
+    if os.path.exists(backup_path):
+        return backup_path
+    os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+    with open(file_path, 'rb') as src, gzip.open(backup_path + '.tmp', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(backup_path + '.tmp', backup_path)
+    return backup_path
+
+def process_subtitle(file_path, shift_seconds, output_dir, stretch=1.0, doc=None,
+                     mode=OUTPUT_FLAT, input_root=None, backup=False):
+    """
+    doc 为已读取的 SubtitleDoc（如预览时的缓存），为空时从文件流式读取。
+    mode 为输出方式，input_root 为扫描的字幕文件夹（保留子目录和备份时使用），
+    backup 为原地修改前是否压缩备份原文件。
+    先写入目标目录下的临时文件再用 os.replace 替换，原地修改时也不会边读边覆盖，
+    中途出错不会留下写了一半的文件。返回前 PREVIEW_CUES 条改动。
+    """
+    fmt = subtitle_format(file_path)
+    if fmt is None:
+        return None, "不支持的字幕格式"
+
+    archive, member = split_archive_path(file_path)
+    if member is not None:
+        if mode == OUTPUT_INPLACE:
+            return process_archive(archive, {member: shift_seconds}, stretch, input_root, backup)[member], None
+        if doc is None:
+            doc = SubtitleDoc.load(file_path, fmt)
+
+    shift_ms = int(round(shift_seconds * 1000))
 
     # 输出路径
-    base_name = os.path.basename(file_path)
-    out_path = os.path.join(output_dir, base_name)
-    with open(out_path, 'w', encoding='utf-8') as f:
-        f.writelines(output_lines)
+    out_path = subtitle_output_path(file_path, mode, output_dir, input_root)
+    tmp_path = out_path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as dst:
+            if doc is not None:
+                output_text, changes = doc.shifted(shift_ms, stretch)
+                dst.write(output_text)
+                # preview_changes 用于预览原时间->新时间
+                preview_changes = changes[:PREVIEW_CUES]
+            else:
+                encoding = detect_encoding(file_path)
+                with open(file_path, 'r', encoding=encoding, errors='ignore') as src:
+                    preview_changes = shift_stream(src, dst, fmt, shift_ms, stretch)
+        if mode == OUTPUT_INPLACE:
+            shutil.copymode(file_path, tmp_path)
+            if backup:
+                backup_subtitle(file_path, input_root)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
     return preview_changes, None
 
-def scan_subtitles(root_dir):
-    matches = []
+def process_subtitle_task(file_path, shift_seconds, output_dir, stretch=1.0, doc=None,
+                          mode=OUTPUT_FLAT, input_root=None, backup=False):
+    """供进程池调用：只回传错误信息，不把整份预览传回主进程"""
+    try:
+        _, err = process_subtitle(file_path, shift_seconds, output_dir, stretch, doc, mode, input_root, backup)
+    except Exception as e:
+        err = str(e)
+    return err
+
+def process_archive(archive_path, shifts, stretch=1.0, input_root=None, backup=False):
+    """
+    原地调整 zip 压缩包内的字幕，shifts 为 包内路径 → 偏移秒数。
+    逐个成员在内存中读取，需要调整的字幕改写后和其余成员一起写入临时压缩包，
+    全部成功后再替换原压缩包，不产生解压目录。返回 包内路径 → 前 PREVIEW_CUES 条改动。
+    """
+    previews = {}
+    tmp_path = archive_path + '.tmp'
+    try:
+        with zipfile.ZipFile(archive_path) as src, zipfile.ZipFile(tmp_path, 'w') as dst:
+            for info in src.infolist():
+                data = src.read(info)
+                if info.filename in shifts:
+                    fmt = subtitle_format(info.filename)
+                    if fmt is None:
+                        raise ValueError(f"不支持的字幕格式: {info.filename}")
+                    shift_ms = int(round(shifts[info.filename] * 1000))
+                    text, newline = decode_subtitle_bytes(data)
+                    text, changes = SubtitleDoc(text, fmt).shifted(shift_ms, stretch)
+                    # 写回时沿用成员原来的换行符
+                    data = text.replace('\n', newline).encode('utf-8')
+                    previews[info.filename] = changes[:PREVIEW_CUES]
+                # 沿用原成员的文件名、时间和压缩方式
+                dst.writestr(info, data)
+        missing = set(shifts) - set(previews)
+        if missing:
+            raise KeyError(f"压缩包中没有 {', '.join(sorted(missing))}")
+        shutil.copymode(archive_path, tmp_path)
+        if backup:
+            backup_subtitle(archive_path, input_root)
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return previews
+
+def process_archive_task(archive_path, shifts, stretch=1.0, input_root=None, backup=False):
+    """供进程池调用：同一压缩包内的字幕一次处理完，只回传错误信息"""
+    try:
+        process_archive(archive_path, shifts, stretch, input_root, backup)
+        err = None
+    except Exception as e:
+        err = str(e)
+    return err
+
+def speech_activity(times, resolution_ms, length):
+    """把 n×2 的起止时间转为长度为 length 的 0/1 语音活动信号，每个点代表 resolution_ms 毫秒"""
+    idx = np.clip(times // resolution_ms, 0, length)
+    edges = np.zeros(length + 1, dtype=np.int64)
+    np.add.at(edges, idx[:, 0], 1)
+    np.add.at(edges, idx[:, 1], -1)
+    return (np.cumsum(edges[:-1]) > 0).astype(np.float64)
+
+def detect_offset(times, ref_times, resolution_ms=SYNC_RESOLUTION_MS, max_offset_s=SYNC_MAX_OFFSET_S):
+    """
+    用 FFT 互相关找出让 times 与参考字幕 ref_times 的语音活动重合最多的偏移，
+    返回 (偏移秒数, 匹配度)，匹配度为重合时长占较短一方对白总时长的比例。
+    """
+    if not len(times) or not len(ref_times):
+        return None, 0.0
+    end_ms = max(np.percentile(times[:, 1], SYNC_LENGTH_PERCENTILE),
+                 np.percentile(ref_times[:, 1], SYNC_LENGTH_PERCENTILE)) + max_offset_s * 1000
+    # 超出范围的对白在 speech_activity 中被截掉
+    end_ms = min(end_ms, max(times.max(), ref_times.max()))
+    length = int(end_ms // resolution_ms) + 1
+    sub = speech_activity(times, resolution_ms, length)
+    ref = speech_activity(ref_times, resolution_ms, length)
+    if not sub.any() or not ref.any():
+        return None, 0.0
+    n = 1 << (2 * length - 1).bit_length()
+    # corr[k] = Σ ref[t]·sub[t-k]，即把字幕延后 k 个点时的重合量；k 为负时位于数组末尾
+    corr = np.fft.irfft(np.fft.rfft(ref, n) * np.conj(np.fft.rfft(sub, n)), n)
+    max_lag = min(length - 1, int(max_offset_s * 1000 // resolution_ms))
+    lags = np.arange(-max_lag, max_lag + 1)
+    values = corr[lags % n]
+    best = int(np.argmax(values))
+    score = values[best] / min(sub.sum(), ref.sum())
+    return float(lags[best] * resolution_ms / 1000), float(score)
+
+def load_subtitle_times(file_path):
+    fmt = subtitle_format(file_path)
+    if fmt is None:
+        raise ValueError("不支持的字幕格式")
+    return subtitle_cache.get(file_path, fmt).times()
+
+def auto_sync_offset(file_path, ref_path, stretch=1.0):
+    """计算 file_path 按 stretch 缩放后相对参考字幕的偏移，返回 (偏移秒数, 匹配度)"""
+    times = retime(load_subtitle_times(file_path), 0, stretch)
+    return detect_offset(times, load_subtitle_times(ref_path))
+
+def episode_key(file_path):
+    """文件名中有季/集号时按季/集号配对，否则按第一个 '.' 之前的主文件名配对"""
+    archive, member = split_archive_path(file_path)
+    name = os.path.basename(member or archive)
+    match = EPISODE_RE.search(name)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return name.split('.')[0].lower()
+
+def match_references(files, ref_path):
+    """
+    为每个字幕找参考字幕：ref_path 为文件时全部使用它，
+    为文件夹时按 episode_key 配对（跳过字幕自身），找不到的不在结果中。
+    """
+    if os.path.isfile(ref_path):
+        return {f: ref_path for f in files if f != ref_path}
+    refs = {}
+    for ref in scan_subtitles(ref_path):
+        refs.setdefault(episode_key(ref), []).append(ref)
+    matched = {}
+    for f in files:
+        candidates = [ref for ref in refs.get(episode_key(f), []) if ref != f]
+        if candidates:
+            matched[f] = candidates[0]
+    return matched
+
+def iter_archive_subtitles(archive_path):
+    """列出 zip 中的字幕，返回 "压缩包路径::包内路径"，损坏或无法读取的压缩包跳过"""
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            names = zf.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return []
+    return [archive_path + ARCHIVE_SEP + name for name in names
+            if not name.endswith('/') and name.lower().endswith(('.srt', '.vtt', '.ass', '.ssa'))]
+
+def iter_subtitles(root_dir):
+    """边遍历边产出字幕文件路径，zip 压缩包内的字幕一并列出"""
     for root, _, files in os.walk(root_dir):
         for f in files:
-            if f.lower().endswith(('.srt', '.vtt')):
-                matches.append(os.path.join(root, f))
-    return matches
+            lower = f.lower()
+            if lower.endswith(('.srt', '.vtt', '.ass', '.ssa')):
+                yield os.path.join(root, f)
+            elif lower.endswith(ARCHIVE_EXTS):
+                yield from iter_archive_subtitles(os.path.join(root, f))
+
+def scan_subtitles(root_dir):
+    return list(iter_subtitles(root_dir))
 
 class SubtitleShiftApp:
     def __init__(self, root):
@@ -110,12 +619,40 @@ class SubtitleShiftApp:
         self.entry_output.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         tk.Button(frame_out, text="选择输出文件夹", command=self.select_output_dir).pack(side=tk.LEFT)
 
+        # 输出方式
+        frame_mode = tk.Frame(root)
+        frame_mode.pack(fill=tk.X, padx=10, pady=5)
+        tk.Label(frame_mode, text="输出方式：").pack(side=tk.LEFT)
+        self.output_mode = tk.StringVar(value=OUTPUT_FLAT)
+        tk.Radiobutton(frame_mode, text="输出文件夹（仅文件名）", variable=self.output_mode, value=OUTPUT_FLAT).pack(side=tk.LEFT)
+        tk.Radiobutton(frame_mode, text="输出文件夹（保留子目录）", variable=self.output_mode, value=OUTPUT_TREE).pack(side=tk.LEFT)
+        tk.Radiobutton(frame_mode, text="原地修改", variable=self.output_mode, value=OUTPUT_INPLACE).pack(side=tk.LEFT)
+        self.backup_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(frame_mode, text="原地修改时压缩备份原文件到 bak 目录", variable=self.backup_var).pack(side=tk.LEFT, padx=10)
+
         # 时间偏移
         frame_shift = tk.Frame(root)
         frame_shift.pack(fill=tk.X, padx=10, pady=5)
         tk.Label(frame_shift, text="时间偏移（秒，支持正负）：").pack(side=tk.LEFT)
         self.entry_shift = tk.Entry(frame_shift, width=10)
         self.entry_shift.pack(side=tk.LEFT, padx=5)
+        tk.Label(frame_shift, text="时间缩放（倍数或 源帧率/目标帧率，如 23.976/25，可留空）：").pack(side=tk.LEFT)
+        self.entry_stretch = tk.Entry(frame_shift, width=12)
+        self.entry_stretch.pack(side=tk.LEFT, padx=5)
+
+        # 自动对齐：与同一集的参考字幕（如其他语言）比对，算出每个文件的偏移
+        frame_sync = tk.Frame(root)
+        frame_sync.pack(fill=tk.X, padx=10, pady=5)
+        tk.Label(frame_sync, text="参考字幕（文件或文件夹）：").pack(side=tk.LEFT)
+        self.entry_ref = tk.Entry(frame_sync)
+        self.entry_ref.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        tk.Button(frame_sync, text="选择文件", command=self.select_ref_file).pack(side=tk.LEFT)
+        tk.Button(frame_sync, text="选择文件夹", command=self.select_ref_dir).pack(side=tk.LEFT, padx=5)
+        tk.Button(frame_sync, text="自动对齐选中文件", command=self.auto_sync).pack(side=tk.LEFT, padx=5)
+        self.use_auto_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame_sync, text="批量处理时使用对齐结果", variable=self.use_auto_var).pack(side=tk.LEFT)
+        # 文件 → 自动对齐得到的偏移秒数
+        self.auto_offsets = {}
 
         # 文件列表
         frame_list = tk.Frame(root)
@@ -147,10 +684,19 @@ class SubtitleShiftApp:
 
         tk.Button(frame_btn, text="扫描字幕文件", command=self.scan_files).pack(side=tk.LEFT)
         tk.Button(frame_btn, text="预览选中文件", command=self.preview_selected).pack(side=tk.LEFT, padx=10)
-        tk.Button(frame_btn, text="开始批量处理", command=self.batch_process).pack(side=tk.LEFT)
+        self.btn_process = tk.Button(frame_btn, text="开始批量处理", command=self.batch_process)
+        self.btn_process.pack(side=tk.LEFT)
+        self.btn_cancel = tk.Button(frame_btn, text="取消处理", command=self.cancel_batch, state=tk.DISABLED)
+        self.btn_cancel.pack(side=tk.LEFT, padx=10)
+        self.progress = ttk.Progressbar(frame_btn, mode="determinate")
+        self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+        self.progress_label = tk.Label(frame_btn, text="")
+        self.progress_label.pack(side=tk.LEFT)
 
         # 日志文件路径
         self.log_path = os.path.join(os.getcwd(), "字幕时间轴调整日志.log")
+        # 每次扫描加一，旧的扫描线程和界面刷新发现编号变了就停止
+        self.scan_id = 0
 
     def select_input_dir(self):
         folder = filedialog.askdirectory()
@@ -164,18 +710,133 @@ class SubtitleShiftApp:
             self.entry_output.delete(0, tk.END)
             self.entry_output.insert(0, folder)
 
+    def select_ref_file(self):
+        path = filedialog.askopenfilename(filetypes=[("字幕文件", "*.srt *.vtt *.ass *.ssa")])
+        if path:
+            self.entry_ref.delete(0, tk.END)
+            self.entry_ref.insert(0, path)
+
+    def select_ref_dir(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.entry_ref.delete(0, tk.END)
+            self.entry_ref.insert(0, folder)
+
+    def auto_sync(self):
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showwarning("提示", "请先选择至少一个字幕文件")
+            return
+        ref_path = self.entry_ref.get().strip()
+        if not os.path.exists(ref_path):
+            messagebox.showerror("错误", "请选择有效的参考字幕文件或文件夹")
+            return
+        stretch = self.get_stretch()
+        if stretch is None:
+            return
+
+        refs = match_references(selected, ref_path)
+        for f in selected:
+            self.tree.set(f, "status", "对齐中" if f in refs else "对齐失败: 没有参考字幕")
+            self.auto_offsets.pop(f, None)
+        self.sync_results = []
+        self.sync_events = queue.Queue()
+        Thread(target=self.run_sync, args=(refs, stretch), daemon=True).start()
+        self.root.after(100, self.poll_sync)
+
+    def run_sync(self, refs, stretch):
+        """后台线程：并行计算各文件的偏移，FFT 计算时不占用 GIL，用线程池即可"""
+        def sync_one(f):
+            try:
+                return f, auto_sync_offset(f, refs[f], stretch), None
+            except Exception as e:
+                return f, None, str(e)
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for result in executor.map(sync_one, refs):
+                self.sync_events.put(result)
+        self.sync_events.put(None)
+
+    def poll_sync(self):
+        while True:
+            try:
+                item = self.sync_events.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.finish_sync()
+                return
+            f, result, err = item
+            if err or result[0] is None:
+                self.tree.set(f, "status", f"对齐失败: {err or '没有可比对的对白'}")
+                continue
+            offset, score = result
+            self.auto_offsets[f] = offset
+            self.sync_results.append(f)
+            self.tree.set(f, "status", f"对齐 {offset:+.2f} 秒（匹配 {score:.0%}）")
+        self.root.after(100, self.poll_sync)
+
+    def finish_sync(self):
+        save_encoding_cache()
+        if len(self.sync_results) == 1:
+            # 只对齐了一个文件时直接填入偏移，可预览后再处理
+            self.entry_shift.delete(0, tk.END)
+            self.entry_shift.insert(0, f"{self.auto_offsets[self.sync_results[0]]:.3f}")
+        messagebox.showinfo("完成", f"自动对齐完成，成功 {len(self.sync_results)} 个文件。\n"
+                                    f"勾选“批量处理时使用对齐结果”即可按各自的偏移处理。")
+
     def scan_files(self):
         input_dir = self.entry_input.get().strip()
         if not os.path.isdir(input_dir):
             messagebox.showerror("错误", "请输入有效的字幕文件夹路径")
             return
-        files = scan_subtitles(input_dir)
+        # 在后台线程遍历目录，结果分批放入队列，由界面用 after() 分批插入，避免大目录卡住窗口
+        self.scan_id += 1
         self.tree.delete(*self.tree.get_children())
-        for f in files:
-            self.tree.insert("", "end", iid=f, text="", values=(f, "未预览"))
-            # 默认选中
-            self.tree.selection_add(f)
-        messagebox.showinfo("完成", f"扫描到 {len(files)} 个字幕文件")
+        self.auto_offsets.clear()
+        self.scan_items = []
+        self.scan_events = queue.Queue()
+        self.progress_label.config(text="已扫描 0 个")
+        Thread(target=self.run_scan, args=(input_dir, self.scan_id, self.scan_events), daemon=True).start()
+        self.root.after(50, self.poll_scan, self.scan_id, self.scan_events)
+
+    def run_scan(self, input_dir, scan_id, events):
+        batch = []
+        for f in iter_subtitles(input_dir):
+            if scan_id != self.scan_id:
+                return
+            batch.append(f)
+            if len(batch) >= SCAN_BATCH:
+                events.put(batch)
+                batch = []
+        if batch:
+            events.put(batch)
+        events.put(None)
+
+    def poll_scan(self, scan_id, events):
+        if scan_id != self.scan_id:
+            return
+        inserted = 0
+        while inserted < SCAN_ROWS_PER_TICK:
+            try:
+                batch = events.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                self.finish_scan()
+                return
+            for f in batch:
+                self.tree.insert("", "end", iid=f, text="", values=(f, "未预览"))
+            self.scan_items.extend(batch)
+            inserted += len(batch)
+        self.progress_label.config(text=f"已扫描 {len(self.scan_items)} 个")
+        self.root.after(50, self.poll_scan, scan_id, events)
+
+    def finish_scan(self):
+        # 默认全部选中，一次设置，避免逐个 selection_add 触发大量选择事件
+        self.tree.selection_set(self.scan_items)
+        self.progress_label.config(text=f"已扫描 {len(self.scan_items)} 个")
+        messagebox.showinfo("完成", f"扫描到 {len(self.scan_items)} 个字幕文件")
 
     def preview_selected(self):
         selected = self.tree.selection()
@@ -188,81 +849,200 @@ class SubtitleShiftApp:
         except:
             messagebox.showerror("错误", "请输入有效的数字时间偏移")
             return
+        stretch = self.get_stretch()
+        if stretch is None:
+            return
 
         self.text_preview.delete("1.0", tk.END)
 
         for f in selected:
-            preview, err = process_subtitle_preview(f, shift_sec)
+            preview, err = process_subtitle_preview(f, shift_sec, stretch)
             if err:
                 self.tree.set(f, "status", f"预览失败: {err}")
                 continue
             self.tree.set(f, "status", "已预览")
             self.text_preview.insert(tk.END, f"文件: {f}\n")
-            for old, new in preview[:10]:  # 预览前10行时间改动
+            for old, new in preview:  # 预览前10行时间改动
                 self.text_preview.insert(tk.END, f"  {old}  -->  {new}\n")
             self.text_preview.insert(tk.END, "\n")
+        save_encoding_cache()
+
+    def get_stretch(self):
+        """读取时间缩放倍数，无效时提示并返回 None"""
+        try:
+            stretch = parse_stretch(self.entry_stretch.get())
+        except (ValueError, ZeroDivisionError):
+            stretch = 0
+        if stretch <= 0:
+            messagebox.showerror("错误", "请输入有效的时间缩放倍数，如 1.001 或 23.976/25")
+            return None
+        return stretch
 
     def batch_process(self):
         selected = self.tree.selection()
         if not selected:
             messagebox.showwarning("提示", "请先选择至少一个字幕文件")
             return
+        use_auto = self.use_auto_var.get()
         shift_str = self.entry_shift.get().strip()
-        if not shift_str:
+        shift_sec = None
+        if not shift_str and not use_auto:
             messagebox.showerror("错误", "请输入时间偏移秒数")
             return
-        try:
-            shift_sec = float(shift_str)
-        except:
-            messagebox.showerror("错误", "请输入有效的时间偏移数值")
+        if shift_str:
+            try:
+                shift_sec = float(shift_str)
+            except:
+                messagebox.showerror("错误", "请输入有效的时间偏移数值")
+                return
+        stretch = self.get_stretch()
+        if stretch is None:
+            return
+        # 勾选使用对齐结果时，对齐过的文件用各自的偏移，其余文件用输入的偏移
+        shifts = {}
+        for f in selected:
+            if use_auto and f in self.auto_offsets:
+                shifts[f] = self.auto_offsets[f]
+            elif shift_sec is not None:
+                shifts[f] = shift_sec
+        if len(shifts) < len(selected):
+            messagebox.showerror("错误", f"有 {len(selected) - len(shifts)} 个文件没有对齐结果，请先自动对齐或填写时间偏移")
             return
 
+        mode = self.output_mode.get()
         output_dir = self.entry_output.get().strip()
-        if not output_dir or not os.path.isdir(output_dir):
+        if mode != OUTPUT_INPLACE and (not output_dir or not os.path.isdir(output_dir)):
             messagebox.showerror("错误", "请选择有效的输出文件夹路径")
             return
+        input_root = self.entry_input.get().strip() or None
+        backup = mode == OUTPUT_INPLACE and self.backup_var.get()
 
-        success_count = 0
-        fail_count = 0
-        log_entries = []
-
+        self.batch_files = list(selected)
+        self.batch_pending = set(selected)
+        self.batch_shift = (shifts, stretch)
+        self.success_count = 0
+        self.fail_count = 0
+        self.log_entries = []
+        self.cancel_event = Event()
+        self.batch_events = queue.Queue()
         for f in selected:
-            preview, err = process_subtitle(f, shift_sec, output_dir)
+            self.tree.set(f, "status", "排队中")
+        self.progress.configure(maximum=len(selected), value=0)
+        self.progress_label.config(text=f"0/{len(selected)}")
+        self.btn_process.config(state=tk.DISABLED)
+        self.btn_cancel.config(state=tk.NORMAL)
+
+        Thread(target=self.run_batch, args=(self.batch_files, shifts, output_dir, stretch, mode, input_root, backup),
+               daemon=True).start()
+        self.root.after(100, self.poll_batch)
+
+    def run_batch(self, files, shifts, output_dir, stretch, mode=OUTPUT_FLAT, input_root=None, backup=False):
+        """
+        后台线程：把文件分发到进程池，每完成一个就把结果放入队列，由主线程更新界面。
+        shifts 为 文件 → 偏移秒数。原地修改时同一压缩包内的字幕合并为一个任务。
+        """
+        def report(future):
+            try:
+                err = future.result()
+            except Exception as e:
+                err = str(e)
+            for f in futures.pop(future):
+                self.batch_events.put((f, err))
+
+        executor = ProcessPoolExecutor()
+        futures = {}
+        try:
+            archives = {}
+            for f in files:
+                archive, member = split_archive_path(f)
+                if member is not None and mode == OUTPUT_INPLACE:
+                    archives.setdefault(archive, []).append(f)
+                    continue
+                # 预览过的文件直接把缓存的文本交给子进程，不再重复读取和检测编码
+                futures[executor.submit(process_subtitle_task, f, shifts[f], output_dir, stretch,
+                                        subtitle_cache.peek(f), mode, input_root, backup)] = [f]
+            for archive, members in archives.items():
+                member_shifts = {split_archive_path(f)[1]: shifts[f] for f in members}
+                futures[executor.submit(process_archive_task, archive, member_shifts, stretch,
+                                        input_root, backup)] = members
+            for future in as_completed(list(futures)):
+                report(future)
+                if self.cancel_event.is_set():
+                    break
+        except Exception as e:
+            self.batch_events.put((None, str(e)))
+        finally:
+            # 取消时丢弃尚未开始的任务，正在处理的文件会写完并照常回报结果
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for future in list(futures):
+                if future.done() and not future.cancelled():
+                    report(future)
+            self.batch_events.put(None)
+
+    def cancel_batch(self):
+        self.cancel_event.set()
+        self.btn_cancel.config(state=tk.DISABLED)
+        self.progress_label.config(text="正在取消...")
+
+    def poll_batch(self):
+        """在主线程中取出处理结果，更新文件状态和进度条"""
+        shifts, stretch = self.batch_shift
+        while True:
+            try:
+                item = self.batch_events.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.finish_batch()
+                return
+            f, err = item
+            if f is None:
+                messagebox.showerror("错误", f"批量处理出错: {err}")
+                continue
+            self.batch_pending.discard(f)
             if err:
                 self.tree.set(f, "status", f"处理失败: {err}")
-                fail_count += 1
-                log_entries.append(f"{datetime.now()} 处理失败 {f} 错误: {err}\n")
+                self.fail_count += 1
+                self.log_entries.append(f"{datetime.now()} 处理失败 {f} 错误: {err}\n")
             else:
                 self.tree.set(f, "status", "处理成功")
-                success_count += 1
-                log_entries.append(f"{datetime.now()} 处理成功 {f} 偏移 {shift_sec} 秒\n")
+                self.success_count += 1
+                self.log_entries.append(f"{datetime.now()} 处理成功 {f} 偏移 {shifts[f]} 秒 缩放 {stretch}\n")
+        done = len(self.batch_files) - len(self.batch_pending)
+        self.progress.configure(value=done)
+        if not self.cancel_event.is_set():
+            self.progress_label.config(text=f"{done}/{len(self.batch_files)}")
+        self.root.after(100, self.poll_batch)
 
+    def finish_batch(self):
+        for f in self.batch_pending:
+            self.tree.set(f, "status", "已取消")
         with open(self.log_path, 'a', encoding='utf-8') as logf:
-            logf.writelines(log_entries)
+            logf.writelines(self.log_entries)
+        self.btn_process.config(state=tk.NORMAL)
+        self.btn_cancel.config(state=tk.DISABLED)
+        done = len(self.batch_files) - len(self.batch_pending)
+        self.progress.configure(value=done)
+        self.progress_label.config(text=f"{done}/{len(self.batch_files)}")
 
-        messagebox.showinfo("完成", f"处理完成！成功: {success_count}，失败: {fail_count}\n日志文件: {self.log_path}")
+        cancelled = f"，取消: {len(self.batch_pending)}" if self.batch_pending else ""
+        messagebox.showinfo("完成", f"处理完成！成功: {self.success_count}，失败: {self.fail_count}{cancelled}\n日志文件: {self.log_path}")
 
-def process_subtitle_preview(file_path, shift_seconds):
-    fmt = os.path.splitext(file_path)[-1].lower().lstrip('.')
-    if fmt not in ['srt', 'vtt']:
+def process_subtitle_preview(file_path, shift_seconds, stretch=1.0, limit=PREVIEW_CUES):
+    fmt = subtitle_format(file_path)
+    if fmt is None:
         return None, "不支持的字幕格式"
 
-    encoding = detect_encoding(file_path)
-
-    with open(file_path, 'r', encoding=encoding, errors='ignore') as f:
-        lines = f.readlines()
-
-    shift_ms = int(shift_seconds * 1000)
-    preview_changes = []
-
-    for line in lines:
-        if '-->' in line:
-            try:
-                old_line = line.strip()
-                new_line = shift_timestamp_line(line, shift_ms, fmt).strip()
-                preview_changes.append((old_line, new_line))
-            except Exception as e:
-                continue
+    shift_ms = int(round(shift_seconds * 1000))
+    if split_archive_path(file_path)[1] is None and os.path.getsize(file_path) > SUBTITLE_CACHE_MAX_FILE:
+        # 大文件不进缓存，只读到凑够预览的时间轴为止
+        with open(file_path, 'r', encoding=detect_encoding(file_path), errors='ignore') as src:
+            preview_changes = shift_stream(src, None, fmt, shift_ms, stretch, limit)
+    else:
+        doc = subtitle_cache.get(file_path, fmt)
+        preview_changes = doc.preview(shift_ms, stretch, limit)
 
     return preview_changes, None
 
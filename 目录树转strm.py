@@ -1,16 +1,83 @@
 import os
 import re
+import ssl
+import queue
+import asyncio
 import json
+import codecs
+import gzip
+import lzma
+import hashlib
+import time
+import bisect
+import struct
+import zlib
+import io
+import tarfile
+import zipfile
+from array import array
 import urllib.parse
+import urllib.request
 import traceback
+import multiprocessing
 import tkinter as tk
-from tkinter import filedialog, scrolledtext
+from tkinter import filedialog, scrolledtext, ttk
 from tkinterdnd2 import TkinterDnD, DND_FILES
-from threading import Thread
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Thread, Condition, Lock
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+# 按 BOM 判断编码的表与字幕/strm 脚本共用
+from 编码检测 import BOMS
 
 CONFIG_FILE = 'config.json'
 VIDEO_EXTS = ['.mp4', '.mkv', '.avi', '.mov', '.flv', '.ts', '.rmvb']
+# 扩展名集合，按最后一个 '.' 截取后缀直接查表
+VIDEO_EXT_SET = frozenset(VIDEO_EXTS)
+# UTF-8 解码失败时改用的编码
+TREE_FALLBACK_ENCODING = 'gb18030'
+# 支持直接读取的压缩目录树
+TREE_FILE_EXTS = ('.txt', '.gz', '.xz')
+# 每次从文件读取并解码的块大小
+READ_BLOCK_SIZE = 1 << 20
+# 目录树行匹配，预编译避免每行重新查找缓存
+TREE_LINE_RE = re.compile(r'^([| ]+)[|\\/\-]+(.*)')
+# 文件名中不能出现的字符
+UNSAFE_NAME_RE = re.compile(r'[\\/:*?"<>|]')
+# 写入线程池中同时排队的最大任务数，避免一次性提交全部任务占满内存
+MAX_PENDING_WRITES = 1000
+# 多进程解析时每个分块包含的行数
+PARSE_CHUNK_LINES = 50000
+# 输出目录下记录上次生成结果（相对路径 → 链接摘要）的清单文件
+MANIFEST_FILE = '.strm_manifest.json'
+# 写入线程数的默认范围，以及自适应调整的统计窗口（秒）
+MIN_WRITE_WORKERS = 2
+MAX_WRITE_WORKERS = 32
+ADAPT_WINDOW = 1.0
+# 媒体服务器（Emby/Jellyfin）按路径刷新的接口，以及每次请求携带的路径数
+MEDIA_UPDATED_API = '/Library/Media/Updated'
+REFRESH_BATCH_SIZE = 100
+# 输出目录以这些后缀结尾时，把 STRM 写入单个归档文件
+ARCHIVE_EXTS = ('.zip', '.tar', '.tar.gz', '.tgz')
+# Alist 列目录接口、每页条数和默认并发数
+ALIST_LIST_API = '/api/fs/list'
+ALIST_PER_PAGE = 200
+ALIST_CONCURRENCY = 8
+# 解析结果缓存目录及文件头
+TREE_CACHE_DIR = '.strm_tree_cache'
+TREE_CACHE_MAGIC = b'STRMTC02'
+TREE_CACHE_HEADER = struct.Struct('<QqII16s')
+# 链接检查：总并发、每个主机的连接数、结果缓存文件、有效结果的保留时间（秒）和失效链接报告
+LINK_CHECK_CONCURRENCY = 64
+LINK_CHECK_PER_HOST = 8
+LINK_CHECK_CACHE_FILE = '.strm_link_cache.json'
+LINK_CHECK_TTL = 7 * 24 * 3600
+LINK_REPORT_FILE = 'strm_dead_links.txt'
+# HEAD 返回这些状态码时，说明服务端不支持 HEAD，改用只取首字节的 GET
+HEAD_UNSUPPORTED = (400, 403, 405, 501)
+# 批量导出时子进程每处理多少个媒体文件回报一次进度
+BATCH_PROGRESS_STEP = 5000
+# 名称搜索索引中每个分块包含的条目数
+NAME_BLOCK_SIZE = 64
 
 def trim_path_by_keyword(path, keyword):
     """
@@ -45,11 +112,1747 @@ def trim_path_by_keyword(path, keyword):
         sub = sub[1:]
     return sub
 
+def is_video_name(name):
+    """按最后一个 '.' 后的后缀（不区分大小写）判断是否为视频文件"""
+    pos = name.rfind('.')
+    return pos != -1 and name[pos:].lower() in VIDEO_EXT_SET
+
+def open_tree_binary(path):
+    """以二进制方式打开目录树，.gz/.xz 压缩文件直接解压读取"""
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if lower.endswith('.xz'):
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+def sniff_tree_encoding(sample, is_whole_file):
+    """
+    根据 BOM 和开头样本一次性确定编码：
+    有 BOM 按 BOM；样本能按 UTF-8 解码则用 UTF-8；
+    大量 0 字节集中在奇数或偶数位时视为无 BOM 的 UTF-16；其余按 GB18030。
+    """
+    for bom, enc in BOMS:
+        if sample.startswith(bom):
+            return enc
+    try:
+        # 样本可能在多字节字符中间截断，未读完整个文件时不做结尾校验
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=is_whole_file)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    half = len(sample) // 2
+    if half:
+        if sample[1::2].count(0) > half // 4:
+            return 'utf-16-le'
+        if sample[0::2].count(0) > half // 4:
+            return 'utf-16-be'
+    return TREE_FALLBACK_ENCODING
+
+def iter_text_lines(path):
+    """
+    逐行读取目录树文件，不把整个文件载入内存。
+    编码只判断一次，之后用增量解码器按块解码；
+    文件后部出现解码错误时，从出错行开始改用 GB18030（非 UTF-8 编码则替换非法字节）继续，
+    不必从头重读。
+    """
+    with open_tree_binary(path) as f:
+        block = f.read(READ_BLOCK_SIZE)
+        extra = f.read(1)
+        encoding = sniff_tree_encoding(block, not extra)
+        block += extra
+        decoder = codecs.getincrementaldecoder(encoding)()
+        pending = ''
+        while True:
+            final = not block
+            state = decoder.getstate()
+            try:
+                text = decoder.decode(block, final)
+            except UnicodeDecodeError as e:
+                if encoding == 'utf-8':
+                    # 出错位置是相对于 缓冲字节 + 本块 的偏移，从出错所在行的行首切换编码
+                    data = state[0] + block
+                    cut = data.rfind(b'\n', 0, e.start) + 1
+                    text = data[:cut].decode('utf-8')
+                    encoding = TREE_FALLBACK_ENCODING
+                    decoder = codecs.getincrementaldecoder(encoding)('replace')
+                    text += decoder.decode(data[cut:], final)
+                else:
+                    # 换成替换非法字节的解码器，并恢复出错前的状态（缓冲的半个字符、UTF-16 字节序），
+                    # 再重新解码本块，上一块末尾的字节不会丢失
+                    decoder = codecs.getincrementaldecoder(encoding)('replace')
+                    decoder.setstate(state)
+                    text = decoder.decode(block, final)
+
+            if text:
+                parts = (pending + text).split('\n')
+                pending = parts.pop()
+                for part in parts:
+                    yield part + '\n'
+            if final:
+                break
+            block = f.read(READ_BLOCK_SIZE)
+        if pending:
+            yield pending
+
+def iter_media_paths(lines, start_keyword=''):
+    """
+    解析目录树的行，逐个产出媒体文件的完整路径（以 / 分隔）。
+    只有命中视频扩展名时才拼接路径。
+    """
+    stack = []
+    processing = not start_keyword
+    match_line = TREE_LINE_RE.match
+
+    for line in lines:
+        line = line.rstrip('\n\r')
+        if not line.strip():
+            continue
+        if start_keyword and start_keyword in line:
+            stack = []
+            processing = True
+            continue
+
+        if not processing:
+            continue
+
+        match = match_line(line)
+        if match:
+            depth = match.group(1).count('|')
+            if depth == 0:
+                continue
+            name = match.group(2).strip()
+
+            del stack[depth:]
+            while len(stack) < depth:
+                stack.append("")
+            stack[-1] = name
+
+            if is_video_name(name):
+                yield '/'.join(stack)
+
+def build_strm_target(path, prefix, ext, start_keyword, encode_url):
+    """
+    计算媒体文件对应的 STRM 相对路径（以 / 分隔）和链接。
+    文件名清理后为空时返回 None。
+    """
+    base = os.path.basename(path)
+    name_without_ext = os.path.splitext(base)[0]
+    safe_name = UNSAFE_NAME_RE.sub('_', name_without_ext)
+    if not safe_name.strip():
+        return None
+    file_name = safe_name + ext
+
+    # 处理路径，截取开始关键词后的路径，保证格式正常
+    trimmed_path = trim_path_by_keyword(path, start_keyword)
+    relative_dir = os.path.dirname(trimmed_path).lstrip('/\\')
+    rel_path = f"{relative_dir}/{file_name}" if relative_dir else file_name
+
+    url_path = '/'.join(urllib.parse.quote(p) for p in trimmed_path.split('/')) if encode_url else trimmed_path
+    full_url = f"{prefix}/{url_path}".replace('//', '/').replace(':/', '://')
+    return rel_path, full_url
+
+class MediaTree:
+    """
+    以父指针表保存解析出的媒体文件：每个目录节点只保存自身名称和父节点下标，
+    共享的路径前缀只存一份；媒体文件记为 (所在目录节点, 文件名)。
+    节点 0 为虚拟根节点，顶层文件直接挂在根节点下。
+    构建时按 (父节点, 目录名) 去重，不保存完整目录路径；构建完成后调用 finish() 释放查找表。
+    """
+    ROOT = 0
+
+    def __init__(self):
+        self.parents = array('i', [-1])
+        self.names = ['']
+        self.media_dirs = array('i')
+        self.media_names = []
+        self.children = {}            # (父节点, 目录名) → 节点，仅在添加时用于去重
+        self.last_dir = (None, None)  # 上一个文件的 (目录路径, 节点)，同目录文件连续出现时免去查找
+
+    def __len__(self):
+        return len(self.media_names)
+
+    def dir_node(self, dir_path):
+        last_path, last_node = self.last_dir
+        if dir_path == last_path:
+            return last_node
+        children = self.children
+        node = self.ROOT
+        for name in dir_path.split('/'):
+            child = children.get((node, name))
+            if child is None:
+                child = len(self.names)
+                self.parents.append(node)
+                self.names.append(name)
+                children[(node, name)] = child
+            node = child
+        self.last_dir = (dir_path, node)
+        return node
+
+    def add(self, path):
+        dir_path, sep, name = path.rpartition('/')
+        self.media_dirs.append(self.dir_node(dir_path) if sep else self.ROOT)
+        self.media_names.append(name)
+
+    def finish(self):
+        """构建完成，释放只在添加时使用的查找表"""
+        self.children = {}
+        self.last_dir = (None, None)
+
+    def dir_path(self, node):
+        """节点对应的目录路径，根节点返回 None"""
+        if node == self.ROOT:
+            return None
+        parts = []
+        while node != self.ROOT:
+            parts.append(self.names[node])
+            node = self.parents[node]
+        return '/'.join(reversed(parts))
+
+    def iter_items(self):
+        """按解析顺序产出 (目录路径, 文件名)，目录路径为 None 表示顶层文件"""
+        last_node = last_path = None
+        for node, name in zip(self.media_dirs, self.media_names):
+            # 同一目录的文件连续存放，目录变化时才重新拼接路径
+            if node != last_node:
+                last_node, last_path = node, self.dir_path(node)
+            yield last_path, name
+
+    def iter_paths(self):
+        for dir_path, name in self.iter_items():
+            yield name if dir_path is None else f"{dir_path}/{name}"
+
+    def folders(self):
+        """与 os.path.dirname(媒体路径) 一致的文件夹列表，每个目录节点只计算一次"""
+        result = set()
+        for node in set(self.media_dirs):
+            dir_path = self.dir_path(node)
+            result.add(os.path.dirname('_' if dir_path is None else f"{dir_path}/_"))
+        return sorted(result)
+
+    def to_bytes(self):
+        texts = '\n'.join(self.names[1:] + self.media_names).encode('utf-8')
+        return self.parents.tobytes() + self.media_dirs.tobytes() + texts
+
+    @classmethod
+    def from_bytes(cls, data, n_nodes, n_media):
+        tree = cls()
+        parents_end = n_nodes * tree.parents.itemsize
+        dirs_end = parents_end + n_media * tree.media_dirs.itemsize
+        tree.parents = array('i')
+        tree.parents.frombytes(data[:parents_end])
+        tree.media_dirs.frombytes(data[parents_end:dirs_end])
+        n_texts = n_nodes - 1 + n_media
+        texts = data[dirs_end:].decode('utf-8').split('\n') if n_texts else []
+        if len(texts) != n_texts:
+            raise ValueError("缓存内容不完整")
+        tree.names = [''] + texts[:n_nodes - 1]
+        tree.media_names = texts[n_nodes - 1:]
+        return tree
+
+class StrmTargetBuilder:
+    """
+    与 build_strm_target 结果一致，但按目录缓存截取后的相对目录和 URL 编码，
+    同一目录下的文件只需处理文件名。
+    """
+
+    def __init__(self, prefix, ext, start_keyword, encode_url):
+        self.prefix = prefix
+        self.ext = ext
+        self.start_keyword = start_keyword
+        self.keyword = start_keyword.replace('\\', '/')
+        self.encode_url = encode_url
+        self.dirs = {}
+
+    def dir_entry(self, dir_path):
+        """
+        返回 (截取后的目录, 相对输出目录, 目录部分的链接)；
+        关键词不在目录部分时返回 None，需按整条路径处理。
+        """
+        entry = self.dirs.get(dir_path, False)
+        if entry is not False:
+            return entry
+        norm = dir_path.replace('\\', '/')
+        if self.keyword:
+            pos = norm.find(self.keyword)
+            if pos == -1:
+                self.dirs[dir_path] = None
+                return None
+            trimmed = '/' + norm[pos:].lstrip('/')
+        else:
+            trimmed = '/' + norm.lstrip('/') if norm.strip('/') else ''
+        relative_dir = os.path.dirname(trimmed + '/_').lstrip('/\\')
+        if self.encode_url:
+            url_dir = '/'.join(urllib.parse.quote(p) for p in trimmed.split('/'))
+        else:
+            url_dir = trimmed
+        entry = (trimmed, relative_dir, url_dir)
+        self.dirs[dir_path] = entry
+        return entry
+
+    def build(self, path):
+        dir_path, _, base = path.rpartition('/')
+        entry = self.dir_entry(dir_path)
+        if entry is None or '\\' in base:
+            return build_strm_target(path, self.prefix, self.ext, self.start_keyword, self.encode_url)
+
+        name_without_ext = os.path.splitext(base)[0]
+        safe_name = UNSAFE_NAME_RE.sub('_', name_without_ext)
+        if not safe_name.strip():
+            return None
+        file_name = safe_name + self.ext
+
+        _, relative_dir, url_dir = entry
+        rel_path = f"{relative_dir}/{file_name}" if relative_dir else file_name
+        url_name = urllib.parse.quote(base) if self.encode_url else base
+        full_url = f"{self.prefix}/{url_dir}/{url_name}".replace('//', '/').replace(':/', '://')
+        return rel_path, full_url
+
+def write_file_bytes(path, data):
+    """直接用底层文件描述符写入，省去文本层和缓冲区的额外开销"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def hash_url(url):
+    return hashlib.blake2b(url.encode('utf-8'), digest_size=8).hexdigest()
+
+def load_manifest(output_dir):
+    """读取输出目录下的清单，不存在或损坏时返回空字典"""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_dir, manifest):
+    """先写临时文件再替换，避免中途中断留下损坏的清单"""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, manifest_path)
+
+def remove_orphans(output_dir, rel_paths, log, removed_paths=None):
+    """
+    删除源文件已不在目录树中的 STRM，并清理随之变空的目录。
+    传入 removed_paths 列表时，把实际删除的相对路径追加进去。
+    """
+    removed = 0
+    root = os.path.abspath(output_dir)
+    for rel in rel_paths:
+        output_path = os.path.join(root, *rel.split('/'))
+        try:
+            os.remove(output_path)
+            removed += 1
+            log(f"[清理] {output_path}")
+            if removed_paths is not None:
+                removed_paths.append(rel)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            log(f"[失败] 清理 {output_path} 错误: {e}")
+            continue
+        parent = os.path.dirname(output_path)
+        while parent != root and parent.startswith(root):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+    return removed
+
+def _parse_tree_chunk(lines, start_keyword, processing):
+    """
+    在子进程中解析一个分块。分块开头的祖先目录未知，
+    每个媒体文件记为 (k, suffix)：前 k 层取自分块之前的目录栈，
+    其余部分 suffix 来自本分块。返回 (媒体列表, 分块结束时的目录栈状态)。
+    k 为 None 表示本分块没有改动过目录栈。
+    """
+    items = []
+    k = None
+    local = []
+    match_line = TREE_LINE_RE.match
+
+    for line in lines:
+        line = line.rstrip('\n\r')
+        if not line.strip():
+            continue
+        if start_keyword and start_keyword in line:
+            k = 0
+            local = []
+            processing = True
+            continue
+
+        if not processing:
+            continue
+
+        match = match_line(line)
+        if match:
+            depth = match.group(1).count('|')
+            if depth == 0:
+                continue
+            name = match.group(2).strip()
+
+            if k is None or depth - 1 < k:
+                k = depth - 1
+                local = [name]
+            else:
+                del local[depth - k:]
+                while len(local) < depth - k:
+                    local.append("")
+                local[-1] = name
+
+            if is_video_name(name):
+                items.append((k, '/'.join(local)))
+    return items, (k, local)
+
+def iter_tree_chunks(lines, start_keyword='', chunk_lines=PARSE_CHUNK_LINES):
+    """按行数切分目录树，产出 (分块, 分块开始时是否已在处理范围内)"""
+    processing = not start_keyword
+    chunk = []
+    chunk_processing = processing
+    for line in lines:
+        chunk.append(line)
+        if not processing and start_keyword in line:
+            processing = True
+        if len(chunk) >= chunk_lines:
+            yield chunk, chunk_processing
+            chunk = []
+            chunk_processing = processing
+    if chunk:
+        yield chunk, chunk_processing
+
+def iter_media_paths_parallel(lines, start_keyword='', workers=None, chunk_lines=PARSE_CHUNK_LINES):
+    """
+    多进程解析目录树，输出顺序和内容与 iter_media_paths 完全一致。
+    主进程只负责切分和按顺序合并：用上一分块结束时的目录栈补全本分块的祖先路径。
+    """
+    workers = workers or os.cpu_count() or 1
+    stack = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        chunks = iter_tree_chunks(lines, start_keyword, chunk_lines)
+        while True:
+            # 同时在途的分块数有上限，避免整个文件堆积在内存中
+            for chunk, processing in chunks:
+                pending.append(executor.submit(_parse_tree_chunk, chunk, start_keyword, processing))
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+
+            items, (k, local) = pending.popleft().result()
+            prefixes = {}
+            for item_k, suffix in items:
+                prefix = prefixes.get(item_k)
+                if prefix is None:
+                    prefix = [stack[i] if i < len(stack) else "" for i in range(item_k)]
+                    prefixes[item_k] = prefix
+                yield '/'.join(prefix + [suffix])
+            if k is not None:
+                stack = [stack[i] if i < len(stack) else "" for i in range(k)] + local
+
+def compare_parse_modes(path, start_keyword='', workers=None):
+    """
+    分别用串行和多进程方式解析同一目录树并比较结果，
+    返回 (是否一致, 串行数量, 并行数量, 串行耗时, 并行耗时, 第一处差异下标)。
+    """
+    t0 = time.perf_counter()
+    serial = list(iter_media_paths(iter_text_lines(path), start_keyword))
+    t1 = time.perf_counter()
+    parallel = list(iter_media_paths_parallel(iter_text_lines(path), start_keyword, workers))
+    t2 = time.perf_counter()
+
+    first_diff = None
+    if serial != parallel:
+        first_diff = next((i for i, (a, b) in enumerate(zip(serial, parallel)) if a != b),
+                          min(len(serial), len(parallel)))
+    return first_diff is None, len(serial), len(parallel), t1 - t0, t2 - t1, first_diff
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.digest()
+
+def tree_cache_path(path, start_keyword):
+    # 解析结果依赖开始关键词，因此与文件路径一起作为缓存文件名
+    key = f"{os.path.abspath(path)}\n{start_keyword}".encode('utf-8')
+    return os.path.join(TREE_CACHE_DIR, hashlib.blake2b(key, digest_size=16).hexdigest() + '.bin')
+
+def load_tree_cache(path, start_keyword):
+    """
+    读取目录树解析缓存，返回 MediaTree，未命中返回 None。
+    大小和修改时间一致时直接命中；只有修改时间变化时比对内容摘要。
+    """
+    cache_path = tree_cache_path(path, start_keyword)
+    try:
+        st = os.stat(path)
+        with open(cache_path, 'rb') as f:
+            if f.read(len(TREE_CACHE_MAGIC)) != TREE_CACHE_MAGIC:
+                return None
+            size, mtime_ns, n_nodes, n_media, digest = TREE_CACHE_HEADER.unpack(f.read(TREE_CACHE_HEADER.size))
+            if size != st.st_size:
+                return None
+            if mtime_ns != st.st_mtime_ns and digest != file_digest(path):
+                return None
+            tree = MediaTree.from_bytes(zlib.decompress(f.read()), n_nodes, n_media)
+    except (OSError, ValueError, struct.error, zlib.error):
+        return None
+
+    if mtime_ns != st.st_mtime_ns:
+        # 内容未变只是修改时间变了，更新缓存头，下次无需再算摘要；
+        # 写入失败不影响本次命中，下次再比对摘要即可
+        try:
+            save_tree_cache(path, start_keyword, st, tree, digest)
+        except OSError:
+            pass
+    return tree
+
+def save_tree_cache(path, start_keyword, st, tree, digest=None):
+    """保存解析结果；解析期间文件被改动时放弃保存"""
+    if digest is None:
+        digest = file_digest(path)
+    current = os.stat(path)
+    if (current.st_size, current.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+        return False
+    os.makedirs(TREE_CACHE_DIR, exist_ok=True)
+    cache_path = tree_cache_path(path, start_keyword)
+    payload = zlib.compress(tree.to_bytes(), 1)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(TREE_CACHE_MAGIC)
+        f.write(TREE_CACHE_HEADER.pack(st.st_size, st.st_mtime_ns, len(tree.names), len(tree), digest))
+        f.write(payload)
+    os.replace(tmp_path, cache_path)
+    return True
+
+class AdaptiveWriterPool:
+    """
+    线程数自适应的写入线程池，接口与 ThreadPoolExecutor 的 submit 一致。
+    每个统计窗口计算吞吐量（文件/秒）和平均单次写入耗时，用爬山法在
+    [min_workers, max_workers] 内增减活跃线程数：吞吐量下降就反向调整，
+    任务队列为空（写入跟不上的是解析而不是磁盘）时保持不变。
+    """
+
+    def __init__(self, min_workers=MIN_WRITE_WORKERS, max_workers=MAX_WRITE_WORKERS, window=ADAPT_WINDOW):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.window = window
+        self.tasks = queue.Queue()
+        self.cond = Condition()
+        self.stats_lock = Lock()
+        self.threads = []
+        self.shutting_down = False
+        self.active = 0
+        self.direction = 1
+        self.last_throughput = None
+        self.window_start = time.perf_counter()
+        self.window_count = 0
+        self.window_latency = 0.0
+        self.started = None
+        self.completed = 0
+        self.total_latency = 0.0
+        self.set_active(min(max(self.min_workers, 10), self.max_workers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def set_active(self, n):
+        with self.cond:
+            self.active = n
+            while len(self.threads) < n:
+                t = Thread(target=self.worker, args=(len(self.threads),), daemon=True)
+                self.threads.append(t)
+                t.start()
+            self.cond.notify_all()
+
+    def submit(self, fn, *args):
+        if self.started is None:
+            self.started = time.perf_counter()
+            self.window_start = self.started
+        future = Future()
+        self.tasks.put((future, fn, args))
+        return future
+
+    def worker(self, index):
+        while True:
+            with self.cond:
+                # 编号超出当前活跃线程数的线程暂停等待
+                while index >= self.active and not self.shutting_down:
+                    self.cond.wait()
+            item = self.tasks.get()
+            if item is None:
+                break
+            future, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            t0 = time.perf_counter()
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            self.record(time.perf_counter() - t0)
+
+    def record(self, latency):
+        with self.stats_lock:
+            self.completed += 1
+            self.total_latency += latency
+            self.window_count += 1
+            self.window_latency += latency
+            now = time.perf_counter()
+            elapsed = now - self.window_start
+            if elapsed < self.window:
+                return
+            throughput = self.window_count / elapsed
+            self.window_start = now
+            self.window_count = 0
+            self.window_latency = 0.0
+            if self.tasks.empty():
+                self.last_throughput = throughput
+                return
+            if self.last_throughput is not None and throughput < self.last_throughput * 0.95:
+                self.direction = -self.direction
+            self.last_throughput = throughput
+            step = max(1, self.active // 4)
+            target = min(self.max_workers, max(self.min_workers, self.active + self.direction * step))
+            if target == self.active:
+                # 碰到上下限时掉头
+                self.direction = -self.direction
+                return
+        self.set_active(target)
+
+    def shutdown(self):
+        with self.cond:
+            self.shutting_down = True
+            self.cond.notify_all()
+        for _ in self.threads:
+            self.tasks.put(None)
+        for t in self.threads:
+            t.join()
+
+    def summary(self):
+        """返回 (最终线程数, 平均吞吐量 文件/秒, 平均单次写入耗时 毫秒)"""
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        latency = self.total_latency / self.completed * 1000 if self.completed else 0.0
+        return self.active, rate, latency
+
+def format_profile(profile):
+    encode = "编码" if profile.get('encode', True) else "不编码"
+    keyword = profile.get('start_keyword') or "无"
+    return f"{profile['prefix']} → {profile['output']} ({profile.get('ext', '.strm')}, {encode}, 截取: {keyword})"
+
+class StrmSyncTarget:
+    """
+    一个输出目标（链接前缀、输出目录、扩展名、URL 编码、路径截取关键词）的写入状态。
+    多个目标共用一次解析和同一个写入线程池，各自维护清单、冲突检测和目录创建。
+    """
+
+    def __init__(self, profile, executor, log, incremental=True):
+        self.profile = profile
+        self.output_dir = profile['output']
+        self.builder = StrmTargetBuilder(profile['prefix'].rstrip('/'), profile.get('ext', '.strm'),
+                                         profile.get('start_keyword', ''), profile.get('encode', True))
+        self.executor = executor
+        self.log = log
+        self.incremental = incremental
+        self.old_manifest = load_manifest(self.output_dir)
+        self.new_manifest = {}
+        # 相对路径 → 来源路径，用于发现清理文件名后重名的来源
+        self.seen = {}
+        self.created_dirs = set()
+        # 相对目录 → 目录中已有的文件名，每个目录只列一次，用于确认跳过的文件仍然存在
+        self.listed_dirs = {}
+        # 本次实际写入或删除了文件的目录（相对路径），用于通知媒体服务器刷新
+        self.changed_dirs = set()
+        self.pending = {}
+        self.count = 0
+        self.total = 0
+        self.skipped = 0
+        self.removed = 0
+
+    def ensure_dir(self, rel_dir):
+        """按目录树顺序逐级创建目录，每个目录只创建一次"""
+        if rel_dir in self.created_dirs:
+            return
+        if not rel_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        else:
+            self.ensure_dir(rel_dir.rpartition('/')[0])
+            try:
+                os.mkdir(os.path.join(self.output_dir, *rel_dir.split('/')))
+            except FileExistsError:
+                pass
+        self.created_dirs.add(rel_dir)
+
+    def file_exists(self, rel_path):
+        """按目录缓存 os.scandir 的结果判断输出文件是否存在，避免逐个文件 stat"""
+        rel_dir, _, name = rel_path.rpartition('/')
+        names = self.listed_dirs.get(rel_dir)
+        if names is None:
+            try:
+                with os.scandir(os.path.join(self.output_dir, *rel_dir.split('/'))) as entries:
+                    names = {entry.name for entry in entries}
+            except OSError:
+                names = set()
+            self.listed_dirs[rel_dir] = names
+        return name in names
+
+    @staticmethod
+    def write_strm(output_path, full_url):
+        try:
+            write_file_bytes(output_path, (full_url + '\n').encode('utf-8'))
+            return f"[写入] {output_path} → {full_url}", 1
+        except Exception as e:
+            return f"[失败] 写入 {output_path} 错误: {e}", 0
+
+    def collect(self, done):
+        for future in done:
+            rel_path, url_digest = self.pending.pop(future)
+            result, ret = future.result()
+            self.log(result)
+            if ret:
+                self.count += 1
+                self.new_manifest[rel_path] = url_digest
+                self.changed_dirs.add(rel_path.rpartition('/')[0])
+
+    def feed(self, path, selected):
+        target = self.builder.build(path)
+        if target is None:
+            self.log(f"[跳过] 空文件名: {path}")
+            return
+        rel_path, full_url = target
+        if rel_path in self.seen:
+            self.log(f"[冲突] {path} 与 {self.seen[rel_path]} 输出到同一文件 {rel_path}，已跳过")
+            return
+        self.seen[rel_path] = path
+
+        # 未选中的文件夹不写入，但保留上次的记录，避免被当作孤立文件清理
+        if not selected:
+            if rel_path in self.old_manifest:
+                self.new_manifest[rel_path] = self.old_manifest[rel_path]
+            return
+
+        self.total += 1
+        url_digest = hash_url(full_url)
+        # 清单记录一致且文件仍在时才跳过，被手动删除的文件会重新生成
+        if self.incremental and self.old_manifest.get(rel_path) == url_digest and self.file_exists(rel_path):
+            self.new_manifest[rel_path] = url_digest
+            self.skipped += 1
+            return
+
+        self.store(rel_path, full_url, url_digest)
+
+    def store(self, rel_path, full_url, url_digest):
+        rel_dir = rel_path.rpartition('/')[0]
+        try:
+            self.ensure_dir(rel_dir)
+        except OSError as e:
+            self.log(f"[失败] 创建目录 {rel_dir} 错误: {e}")
+            return
+        output_path = os.path.join(self.output_dir, *rel_path.split('/'))
+        self.pending[self.executor.submit(self.write_strm, output_path, full_url)] = (rel_path, url_digest)
+        if len(self.pending) >= MAX_PENDING_WRITES:
+            self.collect(wait(self.pending, return_when=FIRST_COMPLETED)[0])
+
+    def finish(self, cleanup=False, complete=True):
+        """
+        等待剩余写入完成，按需清理孤立文件并保存清单。
+        complete 为 False 表示来源没有完整列出，此时不清理，没见到的旧记录原样保留。
+        """
+        self.collect(wait(self.pending)[0])
+        if not complete:
+            for rel_path, url_digest in self.old_manifest.items():
+                if rel_path not in self.seen:
+                    self.new_manifest[rel_path] = url_digest
+        elif cleanup:
+            orphans = [rel for rel in self.old_manifest if rel not in self.seen]
+            removed_paths = []
+            self.removed = remove_orphans(self.output_dir, orphans, self.log, removed_paths)
+            self.changed_dirs.update(rel.rpartition('/')[0] for rel in removed_paths)
+        save_manifest(self.output_dir, self.new_manifest)
+
+    def refresh_paths(self):
+        """
+        变化目录在媒体服务器上的路径：配置了 server_root 时替换输出目录，
+        否则使用本地绝对路径。子目录已被祖先目录覆盖的不再重复通知。
+        """
+        root = self.profile.get('server_root') or os.path.abspath(self.output_dir)
+        sep = '/' if '/' in root or '\\' not in root else '\\'
+        paths = []
+        for rel_dir in collapse_dirs(self.changed_dirs):
+            paths.append(root.rstrip('/\\') + sep + rel_dir.replace('/', sep) if rel_dir else root)
+        return paths
+
+    def summary(self):
+        return (f"[完成] {self.output_dir}：找到 {self.total} 个媒体文件，共生成 {self.count} 个 STRM 文件，"
+                f"跳过未变化 {self.skipped} 个，清理 {self.removed} 个。")
+
+class AsyncHttpPool:
+    """
+    基于 asyncio 流的简易 HTTP/1.1 客户端，复用 keep-alive 连接，
+    连接数（即并发请求数）不超过 size。
+    """
+
+    def __init__(self, base_url, size=ALIST_CONCURRENCY, timeout=30):
+        parts = urllib.parse.urlsplit(base_url)
+        self.host = parts.hostname
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.base_path = parts.path.rstrip('/')
+        self.host_header = parts.netloc
+        self.timeout = timeout
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    async def read_response(self, reader, method='GET', max_body=None):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("连接已关闭")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304):
+            return status, b'', keep_alive
+        length = headers.get('content-length')
+        if max_body is not None and (length is None or int(length) > max_body):
+            # 只关心状态码时不读取大响应体，直接丢弃这个连接
+            return status, b'', False
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, body, keep_alive
+
+    async def request(self, method, path, body=b'', headers=None, max_body=None):
+        head = [f"{method} {self.base_path}{path} HTTP/1.1", f"Host: {self.host_header}",
+                f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        data = ('\r\n'.join(head) + '\r\n\r\n').encode('utf-8') + body
+
+        async with self.slots:
+            # 复用的空闲连接可能已被服务端关闭，失败时换新连接重试一次
+            for attempt in range(2):
+                reused = bool(self.idle)
+                if reused:
+                    reader, writer = self.idle.pop()
+                else:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+                try:
+                    writer.write(data)
+                    await writer.drain()
+                    status, payload, keep_alive = await asyncio.wait_for(self.read_response(reader, method, max_body), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep_alive:
+                    self.idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, payload
+
+    async def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+async def walk_alist(client, root, token='', password='', on_file=None, log=print,
+                     concurrency=ALIST_CONCURRENCY, per_page=ALIST_PER_PAGE):
+    """
+    通过 Alist 的 fs/list 接口并发遍历 root 下的目录，
+    对每个视频文件调用 on_file(路径)，路径为不含开头斜杠的 Alist 完整路径。
+    返回列出失败的目录列表，为空表示遍历完整。
+    """
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = token
+    dirs = asyncio.Queue()
+    dirs.put_nowait('/' + root.strip('/'))
+    failed = []
+
+    async def list_dir(path):
+        page = 1
+        seen = 0
+        while True:
+            body = json.dumps({'path': path, 'password': password, 'page': page,
+                               'per_page': per_page, 'refresh': False}).encode('utf-8')
+            status, payload = await client.request('POST', ALIST_LIST_API, body, headers)
+            result = json.loads(payload.decode('utf-8')) if status == 200 else {}
+            if result.get('code') != 200:
+                raise RuntimeError(result.get('message') or f"HTTP {status}")
+            data = result.get('data') or {}
+            content = data.get('content') or []
+            for item in content:
+                child = f"{path.rstrip('/')}/{item['name']}"
+                if item.get('is_dir'):
+                    dirs.put_nowait(child)
+                elif is_video_name(item['name']):
+                    on_file(child.lstrip('/'))
+            seen += len(content)
+            if not content or seen >= data.get('total', 0):
+                break
+            page += 1
+
+    async def worker():
+        while True:
+            path = await dirs.get()
+            try:
+                await list_dir(path)
+            except Exception as e:
+                failed.append(path)
+                log(f"[失败] 列出 Alist 目录 {path} 错误: {e}")
+            finally:
+                dirs.task_done()
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    try:
+        await dirs.join()
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return failed
+
+class AlistListingError(RuntimeError):
+    """Alist 有目录没能列出，已产出的媒体路径不完整"""
+
+    def __init__(self, failed):
+        super().__init__(f"有 {len(failed)} 个 Alist 目录列出失败")
+        self.failed = failed
+
+def iter_alist_media_paths(api_url, root, token='', password='', log=print, concurrency=ALIST_CONCURRENCY):
+    """
+    在后台线程中运行 walk_alist，把找到的媒体路径逐个产出，
+    与 parse_directory_tree 的结果一样可直接用于生成 STRM。
+    有目录列出失败时，在产出全部找到的路径后抛出 AlistListingError。
+    """
+    results = queue.Queue()
+    done = object()
+
+    async def run():
+        client = AsyncHttpPool(api_url, concurrency)
+        try:
+            return await walk_alist(client, root, token, password, results.put, log, concurrency)
+        finally:
+            await client.close()
+
+    def target():
+        try:
+            failed = asyncio.run(run())
+            if failed:
+                results.put(AlistListingError(failed))
+        except Exception as e:
+            results.put(e)
+        results.put(done)
+
+    Thread(target=target, daemon=True).start()
+    while True:
+        item = results.get()
+        if item is done:
+            break
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+def iter_strm_links(root):
+    """遍历 root 下的 .strm 文件，产出 (文件路径, 链接)，链接取文件的第一行"""
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.name.lower().endswith('.strm'):
+                try:
+                    with open(entry.path, 'rb') as f:
+                        url = f.readline().decode('utf-8', errors='replace').strip()
+                except OSError:
+                    continue
+                if url:
+                    yield entry.path, url
+
+def link_request_target(url):
+    """取出链接的请求路径，未编码的字符（如中文）按 UTF-8 转义，已有的 %xx 保持不变"""
+    parts = urllib.parse.urlsplit(url)
+    target = urllib.parse.quote(parts.path or '/', safe="/%:@!$&'()*+,;=~")
+    if parts.query:
+        target += '?' + urllib.parse.quote(parts.query, safe="/%:@!$&'()*+,;=~?")
+    return target
+
+async def probe_link(client, url):
+    """
+    先发 HEAD，服务端不支持时改用 Range 只取首字节的 GET，返回状态码。
+    不跟随重定向：Alist 等网盘直链找到文件时返回 302，已足以说明链接有效。
+    """
+    target = link_request_target(url)
+    status, _ = await client.request('HEAD', target)
+    if status in HEAD_UNSUPPORTED:
+        status, _ = await client.request('GET', target, headers={'Range': 'bytes=0-0'}, max_body=0)
+    return status
+
+def load_link_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_link_cache(cache_path, cache):
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, cache_path)
+
+async def check_links(urls, concurrency=LINK_CHECK_CONCURRENCY, per_host=LINK_CHECK_PER_HOST,
+                      timeout=15, on_result=None):
+    """
+    并发检查 urls 中的链接，每个主机一个 keep-alive 连接池，连接数不超过 per_host。
+    对每个链接调用 on_result(链接, 状态码或错误信息)。
+    """
+    pending = asyncio.Queue()
+    for url in urls:
+        pending.put_nowait(url)
+    pools = {}
+
+    async def worker():
+        while True:
+            try:
+                url = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            parts = urllib.parse.urlsplit(url)
+            if parts.scheme not in ('http', 'https') or not parts.hostname:
+                on_result(url, "不是 http(s) 链接")
+                continue
+            key = (parts.scheme, parts.netloc)
+            client = pools.get(key)
+            if client is None:
+                client = pools[key] = AsyncHttpPool(f"{parts.scheme}://{parts.netloc}", per_host, timeout)
+            try:
+                result = await probe_link(client, url)
+            except Exception as e:
+                result = f"{type(e).__name__}: {e}"
+            on_result(url, result)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        for client in pools.values():
+            await client.close()
+
+def run_link_check(root, log=print, ttl=LINK_CHECK_TTL, concurrency=LINK_CHECK_CONCURRENCY,
+                   per_host=LINK_CHECK_PER_HOST):
+    """
+    检查 root 下所有 STRM 链接，状态码 >= 400 视为失效，连接失败等记为错误。
+    最近 ttl 秒内确认有效的链接直接跳过；失效和错误的链接写入 root 下的报告。
+    返回 (有效数, 失效数, 错误数, 跳过数, 报告路径)。
+    """
+    cache_path = os.path.join(root, LINK_CHECK_CACHE_FILE)
+    cache = load_link_cache(cache_path)
+    now = time.time()
+
+    files_by_url = {}
+    for path, url in iter_strm_links(root):
+        files_by_url.setdefault(url, []).append(path)
+    fresh = {url for url in files_by_url
+             if url in cache and cache[url][1] < 400 and now - cache[url][0] < ttl}
+    urls = [url for url in files_by_url if url not in fresh]
+    log(f"[检查] 共 {len(files_by_url)} 个链接，{len(fresh)} 个近期已确认有效，待检查 {len(urls)} 个")
+
+    results = {}
+    progress = {'done': 0}
+
+    def on_result(url, result):
+        results[url] = result
+        if isinstance(result, int):
+            cache[url] = [now, result]
+        else:
+            cache.pop(url, None)
+        progress['done'] += 1
+        if progress['done'] % 1000 == 0:
+            log(f"[检查] 已完成 {progress['done']}/{len(urls)}")
+
+    asyncio.run(check_links(urls, concurrency, per_host, on_result=on_result))
+    # 清理输出目录中已不存在的链接，避免缓存无限增长
+    cache = {url: value for url, value in cache.items() if url in files_by_url}
+    save_link_cache(cache_path, cache)
+
+    alive = dead = errors = 0
+    report_path = os.path.join(root, LINK_REPORT_FILE)
+    with open(report_path, 'w', encoding='utf-8') as report:
+        report.write("状态\t链接\t文件\n")
+        for url, result in results.items():
+            if isinstance(result, int) and result < 400:
+                alive += 1
+                continue
+            if isinstance(result, int):
+                dead += 1
+            else:
+                errors += 1
+            for path in files_by_url[url]:
+                report.write(f"{result}\t{url}\t{path}\n")
+    return alive, dead, errors, len(fresh), report_path
+
+def is_archive_path(path):
+    return path.lower().endswith(ARCHIVE_EXTS)
+
+class StrmArchive:
+    """按顺序向 zip 或 tar 归档写入条目，先写临时文件，完成后替换为正式文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.mtime = time.time()
+        lower = path.lower()
+        if lower.endswith('.zip'):
+            self.zip = zipfile.ZipFile(self.tmp_path, 'w', zipfile.ZIP_DEFLATED)
+            self.tar = None
+        else:
+            mode = 'w:gz' if lower.endswith(('.tar.gz', '.tgz')) else 'w'
+            self.tar = tarfile.open(self.tmp_path, mode, format=tarfile.PAX_FORMAT)
+            self.zip = None
+
+    def add(self, name, data):
+        if self.zip is not None:
+            info = zipfile.ZipInfo(name, time.localtime(self.mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            self.zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = self.mtime
+            self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        (self.zip or self.tar).close()
+        os.replace(self.tmp_path, self.path)
+
+def iter_archive_entries(path):
+    """产出归档中的 (相对路径, 内容)"""
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, zf.read(info)
+    else:
+        with tarfile.open(path) as tf:
+            for info in tf:
+                if info.isfile():
+                    yield info.name, tf.extractfile(info).read()
+
+def sync_archive(archive_path, dest_dir, log, cleanup=False):
+    """
+    把 STRM 归档同步到目标目录：只写入内容有变化的条目，
+    可选删除归档中已不存在的文件，最后更新目标目录的清单。
+    返回 (写入数, 未变化数, 清理数)。
+    """
+    old_manifest = load_manifest(dest_dir)
+    new_manifest = {}
+    created_dirs = set()
+    written = unchanged = 0
+    for name, data in iter_archive_entries(archive_path):
+        rel_path = name.replace('\\', '/').lstrip('/')
+        parts = rel_path.split('/')
+        if rel_path == MANIFEST_FILE or '..' in parts:
+            continue
+        url_digest = hash_url(data.decode('utf-8').rstrip('\n'))
+        new_manifest[rel_path] = url_digest
+        output_path = os.path.join(dest_dir, *parts)
+        if old_manifest.get(rel_path) == url_digest and os.path.exists(output_path):
+            unchanged += 1
+            continue
+        target_dir = os.path.dirname(output_path)
+        if target_dir not in created_dirs:
+            os.makedirs(target_dir, exist_ok=True)
+            created_dirs.add(target_dir)
+        write_file_bytes(output_path, data)
+        written += 1
+        log(f"[同步] {output_path}")
+
+    removed = 0
+    if cleanup:
+        orphans = [rel for rel in old_manifest if rel not in new_manifest]
+        removed = remove_orphans(dest_dir, orphans, log)
+    save_manifest(dest_dir, new_manifest)
+    return written, unchanged, removed
+
+def collapse_dirs(rel_dirs):
+    """去掉祖先目录也在集合中的子目录（相对路径以 / 分隔，空字符串为根目录）"""
+    kept = set()
+    for rel_dir in sorted(rel_dirs, key=lambda d: d.count('/') if d else -1):
+        node = rel_dir
+        covered = '' in kept
+        while node and not covered:
+            covered = node in kept
+            node = node.rpartition('/')[0]
+        if not covered:
+            kept.add(rel_dir)
+    return sorted(kept)
+
+def notify_media_server(server_url, api_key, paths, log, batch_size=REFRESH_BATCH_SIZE, timeout=30):
+    """
+    通过 /Library/Media/Updated 接口让 Emby/Jellyfin 只刷新给定路径，
+    路径去重后分批发送。返回成功通知的路径数。
+    """
+    paths = sorted(set(paths))
+    url = server_url.rstrip('/') + MEDIA_UPDATED_API
+    notified = 0
+    for i in range(0, len(paths), batch_size):
+        batch = paths[i:i + batch_size]
+        body = json.dumps({'Updates': [{'Path': p, 'UpdateType': 'Modified'} for p in batch]}).encode('utf-8')
+        request = urllib.request.Request(url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'X-Emby-Token': api_key,
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+            notified += len(batch)
+            log(f"[刷新] 已通知媒体服务器刷新 {len(batch)} 个目录")
+        except Exception as e:
+            log(f"[失败] 通知媒体服务器刷新错误: {e}")
+    return notified
+
+class StrmArchiveTarget(StrmSyncTarget):
+    """
+    归档输出目标：布局和内容与写入磁盘时相同，但全部顺序写入一个 zip/tar 文件，
+    并把清单一并写入归档，供 sync_archive 增量解压。
+    """
+
+    def __init__(self, profile, executor, log, incremental=True):
+        super().__init__(profile, executor, log, incremental=False)
+        self.old_manifest = {}
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_dir)), exist_ok=True)
+        self.archive = StrmArchive(self.output_dir)
+
+    def store(self, rel_path, full_url, url_digest):
+        try:
+            self.archive.add(rel_path, (full_url + '\n').encode('utf-8'))
+        except Exception as e:
+            self.log(f"[失败] 写入归档 {rel_path} 错误: {e}")
+            return
+        self.count += 1
+        self.new_manifest[rel_path] = url_digest
+
+    def finish(self, cleanup=False, complete=True):
+        manifest = json.dumps(self.new_manifest, ensure_ascii=False, separators=(',', ':'))
+        self.archive.add(MANIFEST_FILE, manifest.encode('utf-8'))
+        self.archive.close()
+        self.log(f"[归档] 已写入 {self.output_dir}")
+
+    def refresh_paths(self):
+        # 归档不直接落地到媒体库目录，无需通知刷新
+        return []
+
+def make_sync_target(profile, executor, log, incremental=True):
+    if is_archive_path(profile['output']):
+        return StrmArchiveTarget(profile, executor, log, incremental)
+    return StrmSyncTarget(profile, executor, log, incremental)
+
+def format_export(job):
+    return f"{os.path.basename(job['path'])}：{format_profile(job)}"
+
+def run_export_job(index, job, incremental, cleanup, use_cache, min_workers, max_workers, events):
+    """
+    在子进程中完成一个导出：解析目录树并写入 STRM，全部文件夹都生成。
+    进度和需要关注的日志通过 events 队列以 (序号, 类型, 内容) 回传，返回统计结果字典。
+    """
+    def log(text):
+        # 逐个文件的写入日志数量巨大，批量模式下不回传
+        if not text.startswith('[写入]'):
+            events.put((index, 'log', text))
+
+    started = time.perf_counter()
+    result = {'index': index, 'total': 0, 'count': 0, 'skipped': 0, 'removed': 0,
+              'refresh_paths': [], 'summary': '', 'error': None}
+    try:
+        path = job['path']
+        start_keyword = job.get('start_keyword', '')
+        cached = load_tree_cache(path, start_keyword) if use_cache else None
+        # tree 不为空时表示需要边解析边收集，结束后写入缓存
+        tree = None
+        if cached is not None:
+            log(f"[缓存] 目录树未变化，直接使用缓存的 {len(cached)} 个媒体文件")
+            media_paths = cached.iter_paths()
+        else:
+            st = os.stat(path)
+            media_paths = iter_media_paths(iter_text_lines(path), start_keyword)
+            if use_cache:
+                tree = MediaTree()
+
+        n = 0
+        with AdaptiveWriterPool(min_workers, max_workers) as executor:
+            target = make_sync_target(job, executor, log, incremental)
+            for n, p in enumerate(media_paths, 1):
+                if tree is not None:
+                    tree.add(p)
+                target.feed(p, True)
+                if n % BATCH_PROGRESS_STEP == 0:
+                    events.put((index, 'progress', n))
+            target.finish(cleanup)
+        events.put((index, 'progress', n))
+
+        if tree is not None:
+            tree.finish()
+            try:
+                save_tree_cache(path, start_keyword, st, tree)
+            except OSError as e:
+                log(f"[错误] 保存解析缓存失败: {e}")
+        result.update(total=target.total, count=target.count, skipped=target.skipped, removed=target.removed,
+                      refresh_paths=target.refresh_paths(), summary=target.summary())
+    except Exception as e:
+        result['error'] = f"{e}\n{traceback.format_exc()}"
+    result['elapsed'] = time.perf_counter() - started
+    return result
+
+def run_export_batch(jobs, log, on_progress=None, incremental=True, cleanup=False, use_cache=True,
+                     min_workers=MIN_WRITE_WORKERS, max_workers=MAX_WRITE_WORKERS, processes=None):
+    """
+    用进程池并行处理多个导出，每个进程负责一个导出的解析和写入。
+    汇总各进程回传的进度，调用 on_progress(已处理媒体文件数, 已完成导出数)。
+    返回按 jobs 顺序排列的统计结果列表。
+    """
+    processes = min(len(jobs), processes or os.cpu_count() or 1)
+    results = [None] * len(jobs)
+    progress = [0] * len(jobs)
+
+    def drain(events):
+        while True:
+            try:
+                index, kind, value = events.get_nowait()
+            except queue.Empty:
+                return
+            if kind == 'progress':
+                progress[index] = value
+            else:
+                log(f"[导出 {index + 1}] {value}")
+
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=processes) as executor:
+        events = manager.Queue()
+        futures = {executor.submit(run_export_job, i, job, incremental, cleanup, use_cache,
+                                   min_workers, max_workers, events): i
+                   for i, job in enumerate(jobs)}
+        pending = set(futures)
+        finished = 0
+        while pending:
+            done, pending = wait(pending, timeout=0.5)
+            drain(events)
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    results[index] = {'index': index, 'total': 0, 'count': 0, 'skipped': 0, 'removed': 0,
+                                      'refresh_paths': [], 'summary': '', 'error': str(e), 'elapsed': 0.0}
+                finished += 1
+            if on_progress:
+                on_progress(sum(progress), finished)
+        drain(events)
+    return results
+
+def text_bigrams(text):
+    """
+    返回 text 中所有相邻两个字符（UTF-16 码元）组成的整数集合。
+    UTF-16 编码后每 4 字节正好是两个相邻码元，分别从第 0、1 个码元起按 4 字节取整数，
+    即可在 C 中得到全部相邻字符对，不需要逐个切片。
+    """
+    data = text.encode('utf-16-le')
+    grams = set()
+    for offset in (0, 2):
+        end = offset + (len(data) - offset) // 4 * 4
+        grams.update(memoryview(data[offset:end]).cast('I'))
+    return grams
+
+class NameIndex:
+    """
+    名称搜索索引：条目小写后每 NAME_BLOCK_SIZE 条分为一块，
+    记录 单个字符 / 相邻两个字符 → 包含它的块编号（array 存储）。
+    查询时对查询中的字符对的块列表求交集，只在剩下的块中核对条目，
+    不再扫描全部文本；最近的查询结果会被缓存，删除字符时直接复用。
+    """
+    CACHE_SIZE = 32
+
+    def __init__(self, block_size=NAME_BLOCK_SIZE):
+        self.block_size = block_size
+        self.entries = []    # 条目编号 → 小写文本
+        self.targets = []    # 条目编号 → 对应目录
+        self.blocks = []     # 块编号 → 块内条目以 \0 拼接的文本
+        self.grams = {}      # 字符或字符对 → 包含它的块编号
+        self.cache = {}
+        self.last_query = None
+
+    def add(self, text, target):
+        self.entries.append(text.lower())
+        self.targets.append(target)
+        if len(self.entries) % self.block_size == 0:
+            self.index_block()
+
+    def index_block(self):
+        block_id = len(self.blocks)
+        text = '\0'.join(self.entries[block_id * self.block_size:(block_id + 1) * self.block_size])
+        self.blocks.append(text)
+        grams = self.grams
+        for gram in set(text) | text_bigrams(text):
+            ids = grams.get(gram)
+            if ids is None:
+                ids = grams[gram] = array('i')
+            ids.append(block_id)
+
+    def finish(self):
+        """添加完所有条目后调用，索引最后不满一块的条目"""
+        if len(self.entries) > len(self.blocks) * self.block_size:
+            self.index_block()
+
+    def candidate_blocks(self, query):
+        """返回可能包含 query 的块编号，按编号排序"""
+        grams = self.grams
+        keys = set(query) if len(query) == 1 else text_bigrams(query)
+        postings = sorted((grams.get(key, ()) for key in keys), key=len)
+        blocks = set(postings[0])
+        for ids in postings[1:]:
+            if not blocks:
+                break
+            blocks.intersection_update(ids)
+        return sorted(blocks)
+
+    def scan(self, query):
+        hits = []
+        size = self.block_size
+        entries = self.entries
+        for block_id in self.candidate_blocks(query):
+            if query in self.blocks[block_id]:
+                start = block_id * size
+                hits.extend(i for i in range(start, min(start + size, len(entries))) if query in entries[i])
+        return hits
+
+    def search_ids(self, query):
+        hits = self.cache.get(query)
+        if hits is None:
+            previous = self.cache.get(self.last_query) if self.last_query and self.last_query in query else None
+            if previous is not None and len(previous) < len(self.entries) // self.block_size:
+                # 上次命中已经很少时，直接在其中筛选
+                hits = [i for i in previous if query in self.entries[i]]
+            else:
+                hits = self.scan(query)
+            if len(self.cache) >= self.CACHE_SIZE:
+                self.cache.pop(next(iter(self.cache)))
+            self.cache[query] = hits
+        self.last_query = query
+        return hits
+
+    def search(self, query):
+        """返回文本包含 query（不区分大小写）的条目对应的目录，按条目编号排序"""
+        query = query.lower()
+        if not query:
+            return []
+        targets = self.targets
+        return [targets[i] for i in self.search_ids(query)]
+
+class FolderPicker:
+    """
+    按目录层级展示媒体文件夹的选择树。
+    子节点在展开时才创建，勾选父节点会连同整个子树一起选中或取消，
+    部分选中的目录显示为半选状态。
+    """
+    MARKS = {'all': '☑', 'none': '☐', 'partial': '▣'}
+
+    # 搜索结果最多显示的条数
+    MAX_RESULTS = 2000
+
+    def __init__(self, parent, folders, selected=None, media_paths=None):
+        self.folders = sorted(folders)
+        self.folder_set = set(self.folders)
+        self.selected = set(self.folders if selected is None else selected)
+        self.children = {}   # 目录 → 子目录集合，None 为顶层
+        self.total = {}      # 目录 → 子树中媒体文件夹总数
+        self.count = {}      # 目录 → 子树中已选媒体文件夹数
+        self.loaded = set()  # 已创建子节点的目录
+        self.matches = None  # 当前搜索命中的目录，None 表示未在搜索
+        self.build_index()
+
+        # 名称索引在后台线程建立，建好后该线程继续负责执行搜索，界面线程只显示结果
+        self.name_index = NameIndex()
+        self.index_ready = False
+        self.search_id = 0
+        self.search_requests = queue.Queue()
+        self.search_results = queue.Queue()
+        Thread(target=self.search_worker, args=(media_paths,), daemon=True).start()
+
+        self.tree = ttk.Treeview(parent, columns=("count",), selectmode="browse")
+        self.tree.heading("#0", text="文件夹")
+        self.tree.heading("count", text="已选/总数")
+        self.tree.column("count", width=90, anchor=tk.CENTER)
+        scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.tree.bind('<<TreeviewOpen>>', self.on_open)
+        self.tree.bind('<Button-1>', self.on_click)
+        self.tree.bind('<space>', self.on_space)
+        self.tree.bind('<Destroy>', lambda event: self.search_requests.put(None))
+        self.insert_children(None)
+
+    @staticmethod
+    def parent_of(node):
+        return node.rpartition('/')[0] if '/' in node else None
+
+    @staticmethod
+    def iid_of(node):
+        # Treeview 的根节点 iid 为空字符串，这里统一加前缀避免冲突
+        return '/' + node
+
+    def build_index(self):
+        for folder in self.folders:
+            node = folder
+            is_new = True
+            while node is not None:
+                self.total[node] = self.total.get(node, 0) + 1
+                self.count[node] = self.count.get(node, 0) + (folder in self.selected)
+                parent = self.parent_of(node)
+                if is_new:
+                    siblings = self.children.setdefault(parent, set())
+                    is_new = node not in siblings
+                    siblings.add(node)
+                node = parent
+
+    def build_name_index(self, media_paths):
+        # 每个目录一条：目录名和其中的文件名，以换行分隔，命中时定位到该目录
+        files = {}
+        for p in media_paths or ():
+            files.setdefault(os.path.dirname(p), []).append(p.rpartition('/')[2])
+        index = self.name_index
+        # 按路径顺序编号，命中结果按编号排序即按路径排序
+        for node in sorted(self.total):
+            names = files.get(node)
+            text = node.rpartition('/')[2]
+            index.add(text + '\n' + '\n'.join(names) if names else text, node)
+        index.finish()
+        self.index_ready = True
+
+    def search_worker(self, media_paths):
+        """后台线程：先建立名称索引，再逐个执行搜索请求，积压的请求只处理最新的一个"""
+        self.build_name_index(media_paths)
+        while True:
+            request = self.search_requests.get()
+            try:
+                while True:
+                    request = self.search_requests.get_nowait()
+            except queue.Empty:
+                pass
+            if request is None:
+                return
+            search_id, query = request
+            self.search_results.put((search_id, self.name_index.search(query)))
+
+    def search(self, query, on_done=None):
+        """
+        按名称过滤：命中的目录平铺显示（最多 MAX_RESULTS 条），查询为空时恢复层级视图。
+        查询交给后台线程执行（索引未建好时等建好后执行），结果出来后在界面线程显示，
+        并调用 on_done(命中数量)；之前尚未完成的查询结果会被丢弃。
+        """
+        query = query.strip()
+        self.search_id += 1
+        if not query:
+            if self.matches is not None:
+                self.matches = None
+                self.tree.delete(*self.tree.get_children())
+                self.loaded = set()
+                self.insert_children(None)
+            if on_done:
+                on_done(0)
+            return
+        self.search_requests.put((self.search_id, query))
+        self.tree.after(20, self.poll_search, self.search_id, on_done)
+
+    def poll_search(self, search_id, on_done):
+        if search_id != self.search_id:
+            return
+        try:
+            while True:
+                result_id, matches = self.search_results.get_nowait()
+                if result_id == search_id:
+                    break
+        except queue.Empty:
+            self.tree.after(30, self.poll_search, search_id, on_done)
+            return
+        self.show_matches(matches)
+        if on_done:
+            on_done(len(matches))
+
+    def show_matches(self, matches):
+        self.matches = matches
+        self.tree.delete(*self.tree.get_children())
+        self.loaded = set()
+        for node in self.matches[:self.MAX_RESULTS]:
+            self.tree.insert('', 'end', iid=self.iid_of(node), text=self.item_text(node),
+                             values=(f"{self.count.get(node, 0)}/{self.total[node]}",))
+
+    def select_matches(self, value=True):
+        """选中或取消全部搜索结果（包括超出显示上限的部分）及其子目录"""
+        if not self.matches:
+            return
+        for node in self.matches:
+            self.set_folders(self.subtree_folders(node), value)
+        for node in self.matches[:self.MAX_RESULTS]:
+            self.refresh_item(node)
+
+    def state_of(self, node):
+        n = self.count.get(node, 0)
+        if n == 0:
+            return 'none'
+        return 'all' if n == self.total[node] else 'partial'
+
+    def item_text(self, node):
+        if self.matches is not None:
+            # 搜索结果平铺显示，用完整路径区分同名目录
+            name = node or '(根目录)'
+        else:
+            name = node.rpartition('/')[2] if node else '(根目录)'
+        return f"{self.MARKS[self.state_of(node)]} {name or '(空)'}"
+
+    def insert_children(self, node):
+        parent_iid = '' if node is None else self.iid_of(node)
+        if node is not None:
+            self.tree.delete(*self.tree.get_children(parent_iid))
+        for child in sorted(self.children.get(node, ())):
+            iid = self.iid_of(child)
+            self.tree.insert(parent_iid, 'end', iid=iid, text=self.item_text(child),
+                             values=(f"{self.count.get(child, 0)}/{self.total[child]}",))
+            if child in self.children:
+                # 占位子节点，让展开箭头显示出来
+                self.tree.insert(iid, 'end', text='…')
+        self.loaded.add(node)
+
+    def on_open(self, event):
+        iid = self.tree.focus()
+        node = iid[1:]
+        if iid and self.matches is None and node not in self.loaded:
+            self.insert_children(node)
+
+    def on_click(self, event):
+        if self.tree.identify_region(event.x, event.y) != 'tree':
+            return
+        if 'indicator' in self.tree.identify_element(event.x, event.y):
+            return
+        iid = self.tree.identify_row(event.y)
+        if iid:
+            self.toggle(iid[1:])
+
+    def on_space(self, event):
+        iid = self.tree.focus()
+        if iid:
+            self.toggle(iid[1:])
+
+    def subtree_folders(self, node):
+        """利用排序后的列表按前缀二分查找子树中的媒体文件夹"""
+        lo = bisect.bisect_left(self.folders, node + '/')
+        hi = bisect.bisect_left(self.folders, node + '0')
+        result = self.folders[lo:hi]
+        if node in self.folder_set:
+            result.append(node)
+        return result
+
+    def set_folders(self, folders, value):
+        changed = []
+        for folder in folders:
+            if (folder in self.selected) != value:
+                if value:
+                    self.selected.add(folder)
+                else:
+                    self.selected.discard(folder)
+                changed.append(folder)
+        delta = 1 if value else -1
+        for folder in changed:
+            node = folder
+            while node is not None:
+                self.count[node] += delta
+                node = self.parent_of(node)
+        return changed
+
+    def toggle(self, node):
+        value = self.state_of(node) != 'all'
+        self.set_folders(self.subtree_folders(node), value)
+        self.refresh(node)
+
+    def toggle_all(self):
+        value = len(self.selected) != len(self.folders)
+        self.set_folders(self.folders, value)
+        if self.matches is not None:
+            for node in self.matches[:self.MAX_RESULTS]:
+                self.refresh_item(node)
+            return
+        for node in self.children.get(None, ()):
+            self.refresh_subtree(node)
+
+    def refresh_item(self, node):
+        iid = self.iid_of(node)
+        if self.tree.exists(iid):
+            self.tree.item(iid, text=self.item_text(node),
+                           values=(f"{self.count.get(node, 0)}/{self.total[node]}",))
+
+    def refresh_subtree(self, node):
+        self.refresh_item(node)
+        if node in self.loaded:
+            for child in self.children.get(node, ()):
+                self.refresh_subtree(child)
+
+    def refresh(self, node):
+        """刷新节点本身、已展开的子孙以及所有祖先的勾选状态"""
+        self.refresh_subtree(node)
+        parent = self.parent_of(node)
+        while parent is not None:
+            self.refresh_item(parent)
+            parent = self.parent_of(parent)
+
 class StrmGeneratorApp:
     def __init__(self, root):
         self.root = root
         self.root.title("115 目录树转 STRM 工具")
-        self.root.geometry("800x640")
+        self.root.geometry("820x760")
+        self.root.minsize(760, 560)
         self.folder_choices = set()
         self.selected_folders = set()
         self.create_widgets()
@@ -100,19 +1903,105 @@ class StrmGeneratorApp:
         self.start_keyword_var = tk.StringVar()
         tk.Entry(frame, textvariable=self.start_keyword_var, width=30).grid(row=6, column=1, sticky='w')
 
-        tk.Button(self.root, text="📂 载入并选择生成文件夹", command=self.load_and_select_folders).pack(pady=5)
-        tk.Button(self.root, text="✨ 开始生成 STRM 文件", command=self.start_generation).pack(pady=5)
+        # 增量同步：只写入新增或链接变化的文件，可选清理源已删除的 STRM
+        self.incremental_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(frame, text="增量同步（跳过未变化文件）", variable=self.incremental_var).grid(row=7, column=1, sticky='w')
+        self.cleanup_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="清理源已删除的 STRM", variable=self.cleanup_var).grid(row=7, column=2, sticky='w')
 
-        # 日志输出
-        tk.Label(self.root, text="日志输出：").pack(anchor='w', padx=10)
-        self.log_text = scrolledtext.ScrolledText(self.root, width=95, height=18)
-        self.log_text.pack(padx=10, pady=5)
+        # 多进程解析大目录树
+        self.parallel_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="多进程解析目录树", variable=self.parallel_var).grid(row=8, column=1, sticky='w')
+        tk.Button(frame, text="对比串行/并行解析", command=self.start_compare_parse).grid(row=8, column=2, sticky='w')
+        self.cache_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(frame, text="缓存解析结果", variable=self.cache_var).grid(row=8, column=0, sticky='w')
+
+        # 输出目标列表：一次解析同时写入多个前缀/输出目录，留空则只使用上面的设置
+        tk.Label(frame, text="⑦ 输出目标列表 (可留空)：").grid(row=9, column=0, sticky='nw')
+        self.profiles = []
+        self.profile_list = tk.Listbox(frame, width=60, height=3, selectmode=tk.EXTENDED)
+        self.profile_list.grid(row=9, column=1, sticky='w')
+        profile_btns = tk.Frame(frame)
+        profile_btns.grid(row=9, column=2, sticky='nw')
+        tk.Button(profile_btns, text="添加当前设置", command=self.add_profile).pack(fill='x')
+        tk.Button(profile_btns, text="删除选中", command=self.remove_profile).pack(fill='x')
+
+        # 写入线程数范围，运行时按实测吞吐量在范围内自动调整
+        tk.Label(frame, text="⑧ 写入线程数范围：").grid(row=10, column=0, sticky='w')
+        workers_frame = tk.Frame(frame)
+        workers_frame.grid(row=10, column=1, sticky='w')
+        self.min_workers_var = tk.IntVar(value=MIN_WRITE_WORKERS)
+        self.max_workers_var = tk.IntVar(value=MAX_WRITE_WORKERS)
+        tk.Entry(workers_frame, textvariable=self.min_workers_var, width=5).pack(side='left')
+        tk.Label(workers_frame, text=" ~ ").pack(side='left')
+        tk.Entry(workers_frame, textvariable=self.max_workers_var, width=5).pack(side='left')
+
+        # 可选设置分页放置，避免窗口过高把日志挤出可见区域
+        notebook = ttk.Notebook(self.root)
+        notebook.pack(padx=10, fill='x')
+
+        # 输入来源：导出的目录树文件，或直接通过 Alist 接口列出目录
+        alist_frame = tk.Frame(notebook, padx=10, pady=5)
+        notebook.add(alist_frame, text="输入来源")
+        self.source_var = tk.StringVar(value='file')
+        tk.Radiobutton(alist_frame, text="目录树文件", variable=self.source_var, value='file').grid(row=0, column=0, sticky='w')
+        tk.Radiobutton(alist_frame, text="Alist 实时列表", variable=self.source_var, value='alist').grid(row=0, column=1, sticky='w')
+        tk.Label(alist_frame, text="Alist 地址：").grid(row=1, column=0, sticky='w')
+        self.alist_url_var = tk.StringVar()
+        tk.Entry(alist_frame, textvariable=self.alist_url_var, width=30).grid(row=1, column=1, sticky='w')
+        tk.Label(alist_frame, text="令牌：").grid(row=1, column=2, sticky='w')
+        self.alist_token_var = tk.StringVar()
+        tk.Entry(alist_frame, textvariable=self.alist_token_var, width=20, show='*').grid(row=1, column=3, sticky='w')
+        tk.Label(alist_frame, text="起始目录：").grid(row=2, column=0, sticky='w')
+        self.alist_root_var = tk.StringVar(value='/')
+        tk.Entry(alist_frame, textvariable=self.alist_root_var, width=30).grid(row=2, column=1, sticky='w')
+
+        # 生成后只让媒体服务器刷新变化过的目录
+        server_frame = tk.Frame(notebook, padx=10, pady=5)
+        notebook.add(server_frame, text="媒体服务器刷新（Emby/Jellyfin，可选）")
+        self.refresh_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(server_frame, text="生成后按目录通知刷新", variable=self.refresh_var).grid(row=0, column=0, sticky='w')
+        tk.Label(server_frame, text="服务器地址：").grid(row=0, column=1, sticky='w')
+        self.server_url_var = tk.StringVar()
+        tk.Entry(server_frame, textvariable=self.server_url_var, width=25).grid(row=0, column=2, sticky='w')
+        tk.Label(server_frame, text="API Key：").grid(row=0, column=3, sticky='w')
+        self.server_key_var = tk.StringVar()
+        tk.Entry(server_frame, textvariable=self.server_key_var, width=15, show='*').grid(row=0, column=4, sticky='w')
+        tk.Label(server_frame, text="输出目录在服务器上的路径：").grid(row=1, column=0, sticky='w')
+        self.server_root_var = tk.StringVar()
+        tk.Entry(server_frame, textvariable=self.server_root_var, width=40).grid(row=1, column=1, columnspan=3, sticky='w')
+
+        # 批量导出：每个目录树文件各自的前缀/输出目录/截取关键词，多进程并行生成
+        batch_frame = tk.Frame(notebook, padx=10, pady=5)
+        notebook.add(batch_frame, text="批量导出（多个目录树文件，可选）")
+        self.exports = []
+        self.export_list = tk.Listbox(batch_frame, width=80, height=3, selectmode=tk.EXTENDED)
+        self.export_list.grid(row=0, column=0, sticky='w')
+        export_btns = tk.Frame(batch_frame)
+        export_btns.grid(row=0, column=1, sticky='nw')
+        tk.Button(export_btns, text="添加当前设置", command=self.add_export).pack(fill='x')
+        tk.Button(export_btns, text="删除选中", command=self.remove_export).pack(fill='x')
+
+        # 操作按钮排成两行，节省纵向空间
+        actions = tk.Frame(self.root)
+        actions.pack(pady=5)
+        tk.Button(actions, text="📂 载入并选择生成文件夹", command=self.load_and_select_folders).grid(row=0, column=0, padx=5, pady=2)
+        tk.Button(actions, text="✨ 开始生成 STRM 文件", command=self.start_generation).grid(row=0, column=1, padx=5, pady=2)
+        tk.Button(actions, text="🚀 批量生成全部导出", command=self.start_batch_generation).grid(row=0, column=2, padx=5, pady=2)
+        tk.Button(actions, text="📦 归档增量解压到目录", command=self.start_archive_sync).grid(row=1, column=0, padx=5, pady=2)
+        tk.Button(actions, text="🩺 检查 STRM 链接", command=self.start_link_check).grid(row=1, column=1, padx=5, pady=2)
 
+        # 状态栏先贴底部放置，窗口缩小时日志区先被压缩，状态栏始终可见
         self.status_var = tk.StringVar(value="✅ 等待开始...")
-        tk.Label(self.root, textvariable=self.status_var, anchor='w', fg='blue').pack(fill='x', padx=10, pady=5)
+        tk.Label(self.root, textvariable=self.status_var, anchor='w', fg='blue').pack(side='bottom', fill='x', padx=10, pady=5)
+
+        # 日志输出，随窗口大小伸缩
+        tk.Label(self.root, text="日志输出：").pack(anchor='w', padx=10)
+        self.log_text = scrolledtext.ScrolledText(self.root, width=95, height=10)
+        self.log_text.pack(padx=10, pady=5, fill='both', expand=True)
 
     def browse_file(self):
-        path = filedialog.askopenfilename(filetypes=[("文本文件", "*.txt")])
+        path = filedialog.askopenfilename(filetypes=[("文本文件", "*.txt"), ("压缩目录树", "*.gz *.xz")])
         if path:
             self.path_var.set(path)
 
@@ -123,7 +2012,7 @@ class StrmGeneratorApp:
 
     def on_drop_files(self, event):
         files = self.root.tk.splitlist(event.data)
-        valid_txt_files = [f for f in files if f.lower().endswith('.txt')]
+        valid_txt_files = [f for f in files if f.lower().endswith(TREE_FILE_EXTS)]
         if valid_txt_files:
             self.path_var.set(valid_txt_files[0])
             self.log(f"[拖入] 已设置目录树文件: {valid_txt_files[0]}")
@@ -143,6 +2032,24 @@ class StrmGeneratorApp:
                 self.min_size_var.set(config.get('min_size', 0))
                 self.ext_var.set(config.get('ext', '.strm'))
                 self.start_keyword_var.set(config.get('start_keyword', ''))
+                self.incremental_var.set(config.get('incremental', True))
+                self.cleanup_var.set(config.get('cleanup', False))
+                self.parallel_var.set(config.get('parallel', False))
+                self.cache_var.set(config.get('cache', True))
+                self.source_var.set(config.get('source', 'file'))
+                self.alist_url_var.set(config.get('alist_url', ''))
+                self.alist_root_var.set(config.get('alist_root', '/'))
+                self.min_workers_var.set(config.get('min_workers', MIN_WRITE_WORKERS))
+                self.max_workers_var.set(config.get('max_workers', MAX_WRITE_WORKERS))
+                self.refresh_var.set(config.get('refresh', False))
+                self.server_url_var.set(config.get('server_url', ''))
+                self.server_root_var.set(config.get('server_root', ''))
+                self.profiles = list(config.get('profiles', []))
+                for profile in self.profiles:
+                    self.profile_list.insert(tk.END, format_profile(profile))
+                self.exports = list(config.get('exports', []))
+                for job in self.exports:
+                    self.export_list.insert(tk.END, format_export(job))
             except Exception as e:
                 self.log(f"[错误] 配置文件读取失败: {e}")
 
@@ -155,6 +2062,20 @@ class StrmGeneratorApp:
                 'min_size': self.min_size_var.get(),
                 'ext': self.ext_var.get(),
                 'start_keyword': self.start_keyword_var.get(),
+                'incremental': self.incremental_var.get(),
+                'cleanup': self.cleanup_var.get(),
+                'parallel': self.parallel_var.get(),
+                'cache': self.cache_var.get(),
+                'profiles': self.profiles,
+                'exports': self.exports,
+                'refresh': self.refresh_var.get(),
+                'server_url': self.server_url_var.get(),
+                'server_root': self.server_root_var.get(),
+                'min_workers': self.min_workers_var.get(),
+                'max_workers': self.max_workers_var.get(),
+                'source': self.source_var.get(),
+                'alist_url': self.alist_url_var.get(),
+                'alist_root': self.alist_root_var.get(),
             }
             try:
                 with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -163,60 +2084,90 @@ class StrmGeneratorApp:
                 self.log(f"[错误] 保存配置失败: {e}")
 
     def read_text_file_with_fallback(self, path):
-        for enc in ['utf-8', 'utf-16', 'utf-8-sig', 'gb18030']:
-            try:
-                with open(path, 'r', encoding=enc) as f:
-                    return f.readlines()
-            except UnicodeDecodeError:
-                continue
-        raise UnicodeDecodeError("read", b"", 0, 1, "文件编码错误，建议另存为 UTF-8")
+        """返回按行读取目录树文件的迭代器"""
+        return iter_text_lines(path)
 
     def parse_directory_tree(self, lines):
-        paths = []
-        stack = []
-        processing = False
+        """返回媒体文件路径的生成器，边读边解析"""
         start_keyword = self.start_keyword_var.get().strip()
+        if self.parallel_var.get():
+            return iter_media_paths_parallel(lines, start_keyword)
+        return iter_media_paths(lines, start_keyword)
 
-        for line in lines:
-            line = line.rstrip('\n\r')
-            if not line.strip():
-                continue
-            if start_keyword and start_keyword in line:
-                stack = []
-                processing = True
-                continue
-            if not start_keyword:
-                processing = True
+    def load_media_paths(self, path, collect=False):
+        """
+        返回 (媒体路径可迭代对象, 文件夹列表或 None)。
+        命中缓存时直接返回缓存内容；否则边解析边产出，解析完成后写入缓存。
+        collect 为 True 时先完整解析到 MediaTree，从中取路径和文件夹列表，不再另存一份路径列表。
+        """
+        tree = None
+        if self.source_var.get() == 'alist':
+            self.log(f"[Alist] 开始遍历 {self.alist_url_var.get()} {self.alist_root_var.get()}")
+            media_paths = iter_alist_media_paths(self.alist_url_var.get().strip(), self.alist_root_var.get().strip(),
+                                                 self.alist_token_var.get().strip(), log=self.log)
+        elif not self.cache_var.get():
+            media_paths = self.parse_directory_tree(self.read_text_file_with_fallback(path))
+        else:
+            start_keyword = self.start_keyword_var.get().strip()
+            cached = load_tree_cache(path, start_keyword)
+            if cached is not None:
+                self.log(f"[缓存] 目录树未变化，直接使用缓存的 {len(cached)} 个媒体文件")
+                return cached.iter_paths(), cached.folders()
 
-            if not processing:
-                continue
+            # 边解析边收集到 tree，解析完成后写入缓存
+            tree = MediaTree()
 
-            match = re.match(r'^([| ]+)[|\\/\-]+(.*)', line)
-            if match:
-                prefix = match.group(1)
-                name = match.group(2).strip()
-                depth = prefix.count('|')
+            def parse_and_cache():
+                st = os.stat(path)
+                for p in self.parse_directory_tree(self.read_text_file_with_fallback(path)):
+                    tree.add(p)
+                    yield p
+                tree.finish()
+                try:
+                    save_tree_cache(path, start_keyword, st, tree)
+                except OSError as e:
+                    self.log(f"[错误] 保存解析缓存失败: {e}")
 
-                while len(stack) > depth:
-                    stack.pop()
-                while len(stack) < depth:
-                    stack.append("")
+            media_paths = parse_and_cache()
 
-                if len(stack) == depth:
-                    stack[-1] = name
-                else:
-                    stack.append(name)
+        if not collect:
+            return media_paths, None
+        if tree is None:
+            tree = MediaTree()
+            for p in media_paths:
+                tree.add(p)
+            tree.finish()
+        else:
+            for _ in media_paths:
+                pass
+        return tree.iter_paths(), tree.folders()
 
-                full_path = '/'.join(stack)
-                if any(name.lower().endswith(ext) for ext in VIDEO_EXTS):
-                    paths.append(full_path)
-        return paths
+    def start_compare_parse(self):
+        t = Thread(target=self.compare_parse)
+        t.setDaemon(True)
+        t.start()
+
+    def compare_parse(self):
+        input_path = self.path_var.get()
+        if not input_path or not os.path.exists(input_path):
+            self.log("[错误] 目录树文件路径无效！")
+            return
+        self.log("[对比] 开始串行/并行解析对比...")
+        try:
+            same, n_serial, n_parallel, t_serial, t_parallel, first_diff = compare_parse_modes(
+                input_path, self.start_keyword_var.get().strip())
+            self.log(f"[对比] 串行 {n_serial} 个，用时 {t_serial:.2f} 秒；并行 {n_parallel} 个，用时 {t_parallel:.2f} 秒")
+            if same:
+                self.log("[对比] ✅ 两种解析结果完全一致")
+            else:
+                self.log(f"[对比] ❌ 结果不一致，第一处差异位于第 {first_diff + 1} 个媒体文件")
+        except Exception as e:
+            self.log(f"[错误] 解析对比失败: {e}")
+            self.log(traceback.format_exc())
 
     def load_and_select_folders(self):
         try:
-            lines = self.read_text_file_with_fallback(self.path_var.get())
-            media_paths = self.parse_directory_tree(lines)
-            folder_set = sorted(set(os.path.dirname(p) for p in media_paths))
+            media_paths, folder_set = self.load_media_paths(self.path_var.get(), collect=True)
             self.folder_choices = set(folder_set)
             self.selected_folders = set(folder_set)
 
@@ -224,45 +2175,52 @@ class StrmGeneratorApp:
             win.title("选择需要生成的文件夹")
             win.geometry("500x400")
 
-            tk.Label(win, text="请选择需要生成的文件夹：").pack(anchor='w')
+            tk.Label(win, text="请选择需要生成的文件夹（单击或空格勾选，勾选目录会包含其全部子目录）：").pack(anchor='w')
 
             frame = tk.Frame(win)
-            frame.pack(fill='both', expand=True)
-            canvas = tk.Canvas(frame)
-            scrollbar = tk.Scrollbar(frame, orient="vertical", command=canvas.yview)
-            scrollable_frame = tk.Frame(canvas)
+            picker = FolderPicker(frame, folder_set, media_paths=media_paths)
 
-            scrollable_frame.bind(
-                "<Configure>",
-                lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-            )
+            # 搜索：按文件夹名或文件名过滤，输入停顿后再查询
+            search_frame = tk.Frame(win)
+            search_frame.pack(fill='x')
+            tk.Label(search_frame, text="搜索：").pack(side='left')
+            search_var = tk.StringVar()
+            tk.Entry(search_frame, textvariable=search_var, width=30).pack(side='left')
+            search_info = tk.StringVar()
+            tk.Button(search_frame, text="选中结果", command=lambda: picker.select_matches(True)).pack(side='left')
+            tk.Button(search_frame, text="取消结果", command=lambda: picker.select_matches(False)).pack(side='left')
+            tk.Label(search_frame, textvariable=search_info, fg='gray').pack(side='left', padx=5)
+            pending_search = [None]
 
-            canvas.create_window((0, 0), window=scrollable_frame, anchor='nw')
-            canvas.configure(yscrollcommand=scrollbar.set)
+            def show_count(n):
+                if search_var.get().strip():
+                    shown = min(n, FolderPicker.MAX_RESULTS)
+                    search_info.set(f"命中 {n} 个文件夹" + (f"，显示前 {shown} 个" if shown < n else ""))
+                else:
+                    search_info.set("")
 
-            var_map = {}
+            def run_search():
+                pending_search[0] = None
+                if search_var.get().strip():
+                    search_info.set("搜索中…" if picker.index_ready else "索引建立中…")
+                picker.search(search_var.get(), show_count)
 
-            def toggle_all():
-                new_val = all(var.get() for var in var_map.values())
-                for var in var_map.values():
-                    var.set(not new_val)
+            def on_search_change(*args):
+                if pending_search[0] is not None:
+                    win.after_cancel(pending_search[0])
+                pending_search[0] = win.after(150, run_search)
 
-            tk.Button(win, text="全选 / 反选", command=toggle_all).pack()
+            search_var.trace_add('write', on_search_change)
 
-            for folder in folder_set:
-                var = tk.BooleanVar(value=True)
-                chk = tk.Checkbutton(scrollable_frame, text=folder, variable=var)
-                chk.pack(anchor='w')
-                var_map[folder] = var
+            tk.Button(win, text="全选 / 反选", command=picker.toggle_all).pack()
 
             def on_confirm():
-                self.selected_folders = {k for k,v in var_map.items() if v.get()}
+                self.selected_folders = set(picker.selected)
                 self.log(f"[选择] 共选中 {len(self.selected_folders)} 个文件夹")
                 win.destroy()
 
-            tk.Button(win, text="确定", command=on_confirm).pack(pady=5)
-            scrollbar.pack(side="right", fill="y")
-            canvas.pack(side="left", fill="both", expand=True)
+            tk.Button(win, text="确定", command=on_confirm).pack(side="bottom", pady=5)
+            frame.pack(fill='both', expand=True)
 
         except Exception as e:
             self.log(f"[错误] 加载目录树失败: {e}")
@@ -273,79 +2231,236 @@ class StrmGeneratorApp:
         t.setDaemon(True)
         t.start()
 
+    def current_profile(self):
+        """把主界面上的设置整理为一个输出目标"""
+        return {
+            'prefix': self.prefix_var.get().rstrip('/'),
+            'output': self.output_var.get(),
+            'ext': self.ext_var.get(),
+            'encode': self.encode_var.get(),
+            'start_keyword': self.start_keyword_var.get().strip(),
+            'server_root': self.server_root_var.get().strip(),
+        }
+
+    def add_profile(self):
+        profile = self.current_profile()
+        if not profile['prefix'] or not profile['output']:
+            self.log("[错误] 链接前缀和输出目录不能为空，无法添加输出目标")
+            return
+        self.profiles.append(profile)
+        self.profile_list.insert(tk.END, format_profile(profile))
+        self.log(f"[目标] 已添加: {format_profile(profile)}")
+
+    def remove_profile(self):
+        for index in reversed(self.profile_list.curselection()):
+            self.profile_list.delete(index)
+            removed = self.profiles.pop(index)
+            self.log(f"[目标] 已删除: {format_profile(removed)}")
+
+    def add_export(self):
+        job = self.current_profile()
+        job['path'] = self.path_var.get()
+        if not job['path'] or not os.path.exists(job['path']):
+            self.log("[错误] 目录树文件路径无效，无法添加导出")
+            return
+        if not job['prefix'] or not job['output']:
+            self.log("[错误] 链接前缀和输出目录不能为空，无法添加导出")
+            return
+        self.exports.append(job)
+        self.export_list.insert(tk.END, format_export(job))
+        self.log(f"[导出] 已添加: {format_export(job)}")
+
+    def remove_export(self):
+        for index in reversed(self.export_list.curselection()):
+            self.export_list.delete(index)
+            removed = self.exports.pop(index)
+            self.log(f"[导出] 已删除: {format_export(removed)}")
+
+    def start_batch_generation(self):
+        t = Thread(target=self.batch_generate)
+        t.setDaemon(True)
+        t.start()
+
+    def batch_generate(self):
+        jobs = list(self.exports)
+        if not jobs:
+            self.log("[错误] 导出列表为空，请先添加导出！")
+            self.status_var.set("❌ 导出列表为空！")
+            return
+        missing = [job['path'] for job in jobs if not os.path.exists(job['path'])]
+        if missing:
+            self.log(f"[错误] 以下目录树文件不存在: {', '.join(missing)}")
+            self.status_var.set("❌ 目录树文件路径无效！")
+            return
+
+        self.status_var.set("🔄 批量处理中...")
+        self.log(f"[信息] 开始批量生成 {len(jobs)} 个导出...")
+        started = time.perf_counter()
+
+        def on_progress(media_count, finished):
+            self.status_var.set(f"🔄 批量处理中：已完成 {finished}/{len(jobs)} 个导出，已处理 {media_count} 个媒体文件")
+
+        try:
+            results = run_export_batch(jobs, self.log, on_progress, self.incremental_var.get(),
+                                       self.cleanup_var.get(), self.cache_var.get(),
+                                       self.min_workers_var.get(), self.max_workers_var.get())
+        except Exception as e:
+            self.log(f"[异常] 批量生成过程中出现错误: {e}")
+            self.log(traceback.format_exc())
+            self.status_var.set("❌ 批量生成失败！")
+            return
+
+        failed = 0
+        for job, result in zip(jobs, results):
+            self.log(f"[导出] {format_export(job)}（耗时 {result['elapsed']:.1f} 秒）")
+            if result['error']:
+                failed += 1
+                self.log(f"[失败] {result['error']}")
+            else:
+                self.log(result['summary'])
+
+        if self.refresh_var.get():
+            server_url = self.server_url_var.get().strip()
+            paths = [p for result in results for p in result['refresh_paths']]
+            if not server_url:
+                self.log("[提示] 未填写媒体服务器地址，跳过刷新通知")
+            elif paths:
+                notified = notify_media_server(server_url, self.server_key_var.get().strip(), paths, self.log)
+                self.log(f"[刷新] 共通知 {notified} 个目录")
+
+        count = sum(r['count'] for r in results)
+        skipped = sum(r['skipped'] for r in results)
+        removed = sum(r['removed'] for r in results)
+        self.log(f"[完成] 批量生成 {len(jobs)} 个导出，失败 {failed} 个，共耗时 {time.perf_counter() - started:.1f} 秒")
+        self.status_var.set(f"✅ 批量完成，生成 {count} 个文件，跳过 {skipped} 个，清理 {removed} 个，失败 {failed} 个导出。")
+        self.save_config()
+
+    def start_archive_sync(self):
+        archive_path = filedialog.askopenfilename(filetypes=[("STRM 归档", "*.zip *.tar *.tar.gz *.tgz")])
+        if not archive_path:
+            return
+        dest_dir = filedialog.askdirectory(title="选择解压目标目录")
+        if not dest_dir:
+            return
+        t = Thread(target=self.archive_sync, args=(archive_path, dest_dir))
+        t.setDaemon(True)
+        t.start()
+
+    def archive_sync(self, archive_path, dest_dir):
+        self.status_var.set("🔄 同步归档中...")
+        try:
+            written, unchanged, removed = sync_archive(archive_path, dest_dir, self.log, self.cleanup_var.get())
+            self.log(f"[完成] 归档同步：写入 {written} 个，未变化 {unchanged} 个，清理 {removed} 个。")
+            self.status_var.set(f"✅ 归档同步完成，写入 {written} 个文件。")
+        except Exception as e:
+            self.log(f"[异常] 归档同步失败: {e}")
+            self.log(traceback.format_exc())
+            self.status_var.set("❌ 归档同步失败！")
+
+    def start_link_check(self):
+        root = filedialog.askdirectory(title="选择要检查的 STRM 目录", initialdir=self.output_var.get() or None)
+        if not root:
+            return
+        t = Thread(target=self.link_check, args=(root,))
+        t.setDaemon(True)
+        t.start()
+
+    def link_check(self, root):
+        self.status_var.set("🔄 检查链接中...")
+        try:
+            alive, dead, errors, skipped, report_path = run_link_check(root, self.log)
+            self.log(f"[完成] 链接检查：有效 {alive} 个，失效 {dead} 个，错误 {errors} 个，跳过 {skipped} 个。")
+            self.log(f"[报告] {report_path}")
+            self.status_var.set(f"✅ 链接检查完成，失效 {dead} 个，错误 {errors} 个。")
+        except Exception as e:
+            self.log(f"[异常] 链接检查失败: {e}")
+            self.log(traceback.format_exc())
+            self.status_var.set("❌ 链接检查失败！")
+
+    def refresh_media_server(self, targets):
+        server_url = self.server_url_var.get().strip()
+        if not server_url:
+            self.log("[提示] 未填写媒体服务器地址，跳过刷新通知")
+            return
+        paths = [p for target in targets for p in target.refresh_paths()]
+        if not paths:
+            self.log("[刷新] 没有变化的目录，无需通知媒体服务器")
+            return
+        notified = notify_media_server(server_url, self.server_key_var.get().strip(), paths, self.log)
+        self.log(f"[刷新] 共通知 {notified} 个目录")
+
     def generate_strm(self):
         self.status_var.set("🔄 处理中...")
         self.log("开始生成 STRM 文件...")
         try:
             input_path = self.path_var.get()
-            prefix = self.prefix_var.get().rstrip('/')
-            output_dir = self.output_var.get()
-            min_size = self.min_size_var.get()
-            ext = self.ext_var.get()
-            start_keyword = self.start_keyword_var.get().strip()
-            encode_url = self.encode_var.get()
+            # 没有配置输出目标列表时，使用主界面的设置作为唯一目标
+            profiles = list(self.profiles) or [self.current_profile()]
 
-            if not input_path or not os.path.exists(input_path):
+            if self.source_var.get() == 'alist':
+                if not self.alist_url_var.get().strip():
+                    self.log("[错误] 请填写 Alist 地址！")
+                    self.status_var.set("❌ Alist 地址为空！")
+                    return
+            elif not input_path or not os.path.exists(input_path):
                 self.log("[错误] 目录树文件路径无效！")
                 self.status_var.set("❌ 目录树文件路径无效！")
                 return
-            if not prefix:
-                self.log("[错误] 请填写 Alist 链接前缀！")
-                self.status_var.set("❌ 链接前缀为空！")
-                return
-            if not output_dir:
-                self.log("[错误] 请选择 STRM 输出目录！")
-                self.status_var.set("❌ STRM 输出目录为空！")
-                return
+            for profile in profiles:
+                if not profile['prefix']:
+                    self.log("[错误] 请填写 Alist 链接前缀！")
+                    self.status_var.set("❌ 链接前缀为空！")
+                    return
+                if not profile['output']:
+                    self.log("[错误] 请选择 STRM 输出目录！")
+                    self.status_var.set("❌ STRM 输出目录为空！")
+                    return
+
+            incremental = self.incremental_var.get()
+            cleanup = self.cleanup_var.get()
+            media_paths, _ = self.load_media_paths(input_path)
+            selected_folders = self.selected_folders
+            self.log(f"[信息] 开始解析目录树并写入 {len(profiles)} 个输出目标...")
+
+            min_workers = self.min_workers_var.get()
+            max_workers = self.max_workers_var.get()
+            with AdaptiveWriterPool(min_workers, max_workers) as executor:
+                targets = [make_sync_target(profile, executor, self.log, incremental) for profile in profiles]
+                # 一次解析同时供给所有输出目标，边解析边写入
+                complete = True
+                try:
+                    for p in media_paths:
+                        selected = os.path.dirname(p) in selected_folders
+                        for target in targets:
+                            target.feed(p, selected)
+                except AlistListingError as e:
+                    # 列表不完整时，没列出的目录下的 STRM 不能当作孤立文件删除
+                    complete = False
+                    self.log(f"[警告] {e}，本次不清理孤立文件，已生成的文件照常保留")
+                for target in targets:
+                    target.finish(cleanup, complete)
+
+            for target in targets:
+                self.log(target.summary())
+            if self.refresh_var.get():
+                self.refresh_media_server(targets)
+            workers, rate, latency = executor.summary()
+            if executor.completed:
+                self.log(f"[线程] 写入线程数最终稳定在 {workers}，平均 {rate:.0f} 个文件/秒，"
+                         f"单次写入平均 {latency:.1f} 毫秒")
 
-            lines = self.read_text_file_with_fallback(input_path)
-            media_paths = self.parse_directory_tree(lines)
-            # 过滤选择的文件夹
-            media_paths = [p for p in media_paths if os.path.dirname(p) in self.selected_folders]
-            if not media_paths:
+            count = sum(t.count for t in targets)
+            skipped = sum(t.skipped for t in targets)
+            removed = sum(t.removed for t in targets)
+            if not any(t.total for t in targets) and not removed:
                 self.log("[提示] 没有找到符合条件的媒体文件。")
                 self.status_var.set("⚠️ 没有符合条件的文件。")
                 return
 
-            total_files = len(media_paths)
-            self.log(f"[信息] 找到 {total_files} 个媒体文件，开始写入...")
-
-            def write_strm(path):
-                try:
-                    base = os.path.basename(path)
-                    name_without_ext = os.path.splitext(base)[0]
-                    safe_name = re.sub(r'[\\/:*?"<>|]', '_', name_without_ext)
-                    if not safe_name.strip():
-                        return "[跳过] 空文件名", 0
-                    file_name = safe_name + ext
-
-                    # 处理路径，截取开始关键词后的路径，保证格式正常
-                    trimmed_path = trim_path_by_keyword(path, start_keyword)
-                    relative_dir = os.path.dirname(trimmed_path).lstrip('/\\')
-                    target_dir = os.path.join(output_dir, relative_dir)
-                    os.makedirs(target_dir, exist_ok=True)
-
-                    url_path = '/'.join(urllib.parse.quote(p) for p in trimmed_path.split('/')) if encode_url else trimmed_path
-                    full_url = f"{prefix}/{url_path}".replace('//', '/').replace(':/', '://')
-
-                    output_path = os.path.join(target_dir, file_name)
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        f.write(full_url + '\n')
-                    return f"[写入] {output_path} → {full_url}", 1
-                except Exception as e:
-                    return f"[失败] 写入 {path} 错误: {e}", 0
-
-            count = 0
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                futures = {executor.submit(write_strm, p): p for p in media_paths}
-                for future in as_completed(futures):
-                    result, ret = future.result()
-                    self.log(result)
-                    if ret:
-                        count += 1
-
-            self.log(f"[完成] 共生成 {count} 个 STRM 文件。")
-            self.status_var.set(f"✅ 完成，生成 {count} 个文件。")
+            if complete:
+                self.status_var.set(f"✅ 完成，生成 {count} 个文件，跳过 {skipped} 个，清理 {removed} 个。")
+            else:
+                self.status_var.set(f"⚠️ 部分目录列出失败，生成 {count} 个文件，跳过 {skipped} 个，未清理。")
             self.save_config()
         except Exception as e:
             self.log(f"[异常] 生成过程中出现错误: {e}")
@@ -0,0 +1,117 @@
+"""
+字幕时间批量前后移.py 和 strm内路径替换.py 共用的文本编码检测。
+先按 BOM 和严格 UTF-8 解码判断，失败时才使用 chardet；
+结果按 (路径, 大小, 修改时间) 缓存到磁盘，重复扫描时直接跳过检测；
+每次运行第一次保存时清理已删除或改名的文件的记录，缓存不会无限增长。
+"""
+import os
+import json
+import codecs
+import chardet
+from threading import Lock
+
+# 编码检测缓存文件
+ENCODING_CACHE_FILE = 'encoding_cache.json'
+# 检测时读取的文件开头字节数
+SAMPLE_SIZE = 64 * 1024
+# 按 BOM 判断编码，UTF-32 的 BOM 以 UTF-16 的 BOM 开头，需先判断
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+def sniff_encoding(raw, complete=True):
+    """
+    判断一段字节的编码。complete 为 False 表示 raw 只是文件开头，
+    末尾被截断的多字节字符不算解码失败。
+    """
+    for bom, encoding in BOMS:
+        if raw.startswith(bom):
+            return encoding
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(raw, final=complete)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    result = chardet.detect(raw)
+    return result['encoding'] or 'utf-8'
+
+class EncodingDetector:
+    """带磁盘缓存的编码检测，缓存在第一次检测时读取，调用 save() 时写回"""
+
+    def __init__(self, cache_file=ENCODING_CACHE_FILE):
+        self.cache_file = cache_file
+        self.cache = None
+        self.dirty = False
+        self.lock = Lock()
+        # 本次运行中检测或命中过的路径，清理时视为仍然存在，无需再查
+        self.seen = set()
+        self.pruned = False
+
+    def load(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.cache = data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            self.cache = {}
+
+    def detect(self, file_path):
+        st = os.stat(file_path)
+        key = os.path.abspath(file_path)
+        with self.lock:
+            if self.cache is None:
+                self.load()
+            entry = self.cache.get(key)
+            self.seen.add(key)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+
+        with open(file_path, 'rb') as f:
+            raw = f.read(SAMPLE_SIZE)
+        encoding = sniff_encoding(raw, complete=len(raw) >= st.st_size)
+        with self.lock:
+            self.cache[key] = [st.st_size, st.st_mtime_ns, encoding]
+            self.dirty = True
+        return encoding
+
+    def prune(self):
+        """删除路径已不存在的记录，文件检查在锁外进行，不阻塞同时进行的检测"""
+        with self.lock:
+            keys = [key for key in self.cache if key not in self.seen]
+        missing = [key for key in keys if not os.path.exists(key)]
+        with self.lock:
+            for key in missing:
+                self.cache.pop(key, None)
+            if missing:
+                self.dirty = True
+            self.pruned = True
+
+    def save(self):
+        """有新的检测结果或清理了记录时写回缓存，先写临时文件再替换"""
+        if self.cache is None:
+            return
+        if not self.pruned:
+            self.prune()
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_path = self.cache_file + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.cache, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(tmp_path, self.cache_file)
+                self.dirty = False
+            except OSError:
+                pass
+
+detector = EncodingDetector()
+
+def detect_encoding(file_path):
+    return detector.detect(file_path)
+
+def save_encoding_cache():
+    detector.save()